@@ -8,7 +8,11 @@ __email__ = "rlim.email@gmail.com"
 __version__ = "0.1.0"
 BIBLE_DATA_DIR = Path(__file__).parent / "data" / "bible"
 SEARCH_DATA_DIR = Path(__file__).parent / "data" / "search"
+TEXT_DATA_DIR = Path(__file__).parent / "data" / "text"
 IMG_DATA_DIR = Path(__file__).parent / "data" / "img"
+CLOUD_DATA_DIR = Path(__file__).parent / "data" / "cloud"
 Path(BIBLE_DATA_DIR).mkdir(parents=True, exist_ok=True, mode=0o755)
 Path(SEARCH_DATA_DIR).mkdir(parents=True, exist_ok=True, mode=0o755)
+Path(TEXT_DATA_DIR).mkdir(parents=True, exist_ok=True, mode=0o755)
 Path(IMG_DATA_DIR).mkdir(parents=True, exist_ok=True, mode=0o755)
+Path(CLOUD_DATA_DIR).mkdir(parents=True, exist_ok=True, mode=0o755)
@@ -1,21 +1,60 @@
-import requests
-import json
-import spacy  # type: ignore
-
-from dataclasses import dataclass
-from typing import Optional, ClassVar, Dict, List, Callable
-from diskcache import Index, Cache  # type: ignore
-from multiprocessing import Pool
-from functools import partial
-from collections import ChainMap
-
-from ipybible import BIBLE_DATA_DIR, SEARCH_DATA_DIR
+import numpy as np  # type: ignore
+import os
+import shutil
+
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from heapq import merge
+from dataclasses import dataclass, InitVar, replace
+from itertools import repeat
+from pathlib import Path
+from typing import (
+    Any,
+    Optional,
+    ClassVar,
+    Dict,
+    List,
+    Callable,
+    Hashable,
+    Iterable,
+    Iterator,
+    Tuple,
+    Union,
+)
+from diskcache import Index  # type: ignore
+
+from ipybible import BIBLE_DATA_DIR
 from ipybible.books import BOOKS
-from ipybible.similarity import cosine_sim, SpacyLangModel, normalize_text
+from ipybible.corpus import (
+    Corpus,
+    CorpusFormatError,
+    lemma_counts,
+    read_corpus_file,
+    write_corpus_file,
+)
+from ipybible.download import BASE_URL, BibleNotFound, BookDownloader, read_books
+from ipybible.index import NgramIndex, VerseIndex
+from ipybible.scoring import DEFAULT_SCORING, score_texts, scorer_class
+from ipybible.similarity import (
+    TEXT_INDEX,
+    cosine_sim,
+    SpacyModels,
+    normalize_text,
+    normalize_texts,
+    Query,
+    text_key,
+)
 from ipybible.misc import sort_dict, normalize
+from ipybible.store import LRUIndex, SEARCH, corpus_index, get_many, set_many
 
-BIBLE_INDEX = Index(str(BIBLE_DATA_DIR))
-SEARCH_CACHE = Cache(str(SEARCH_DATA_DIR))
+# Versions stored by a former layout, until migrated
+BIBLE_INDEX = corpus_index()
+SEARCH_CACHE = SEARCH.open()
+# Search results, read from the store every time for the most searched to be kept
+SEARCH_INDEX = LRUIndex(SEARCH_CACHE)
+# Part of the search results' keys, to be changed along with the scoring
+SCORING_VERSION = 1
+SEARCH_LEVELS = ("book", "chapter", "verse")
 # Path(BIBLE_DATA_DIR).chmod(0o755)
 # Path(BIBLE_DATA_DIR / "cache.db").chmod(0o755)
 # Path(SEARCH_DATA_DIR).chmod(0o755)
@@ -26,19 +65,149 @@ BookName = str
 ChapterNum = int
 SimRatio = float
 
-LANGUAGE_TO_MODEL = {
-    "EN": SpacyLangModel(
-        nlp=spacy.load("en_core_web_sm"), stop_words=spacy.lang.en.stop_words.STOP_WORDS
-    ),
-    "NL": SpacyLangModel(
-        nlp=spacy.load("nl_core_news_sm"),
-        stop_words=spacy.lang.nl.stop_words.STOP_WORDS,
-    ),
-}
+# Memory-mapped corpora per bible's version
+CORPORA: Dict[str, Corpus] = {}
+# Memory-mapped n-gram indexes per bible's version
+NGRAM_INDEXES: Dict[str, NgramIndex] = {}
+VERSE_INDEXES: Dict[str, VerseIndex] = {}
+# Bible loaded once by every worker of a search executor
+WORKER_BIBLE: Optional["Bible"] = None
+# Bibles loaded by a worker of the executor shared by all versions, per version
+WORKER_BIBLES: Dict[Tuple[str, str], "Bible"] = {}
+SHARED_EXECUTOR: Optional[ProcessPoolExecutor] = None
+SHARED_EXECUTOR_WORKERS = 0
+
+# Models are loaded on the first use of their language
+LANGUAGE_TO_MODEL = SpacyModels(
+    language_to_name={"EN": "en_core_web_sm", "NL": "nl_core_news_sm"}
+)
+
+
+def preload_models(*languages: str) -> None:
+    """
+    Load spacy models at startup instead of on the first search or cleaning
+    :param languages: languages to load, e.g EN, default to all of them
+    :return: None
+    """
+    LANGUAGE_TO_MODEL.preload(*languages)
+
+
+# Comma separated languages to load on import, e.g IPYBIBLE_PRELOAD_LANGUAGES=EN
+PRELOAD_LANGUAGES = [
+    language.strip().upper()
+    for language in os.environ.get("IPYBIBLE_PRELOAD_LANGUAGES", "").split(",")
+    if language.strip()
+]
+if PRELOAD_LANGUAGES:
+    preload_models(*PRELOAD_LANGUAGES)
+
+
+def prepare_query(query: Union[str, Query], language: str) -> Query:
+    """
+    Normalize and vectorize a query text once, to be passed down to the scoring
+    :param query: query text, or an already prepared query
+    :param language: language of the query, e.g EN
+    :return: Query
+    """
+    if isinstance(query, Query):
+        return query
+    return Query.prepare(
+        text=query, spacy_model=LANGUAGE_TO_MODEL[language], index_name=TEXT_INDEX
+    )
+
+
+def search_key(name: str, *args: Hashable) -> Tuple:
+    """
+    Key of a search result, made of the version, language, (book) and clean query,
+    instead of the pickled Bible or Book
+    :param name: name of the search, e.g book_to_similarity
+    :param args: arguments the result depends on
+    :return: key
+    """
+    return (name, SCORING_VERSION) + args
+
+
+def cached_search(key: Tuple, compute: Callable[[], Any]) -> Any:
+    """
+    Search result, computed and stored in SEARCH_INDEX unless found there
+    :param key: key of the search result
+    :param compute: function computing the result
+    :return: search result
+    """
+    result = SEARCH_INDEX.get(key)
+    if result is None:
+        result = compute()
+        SEARCH_INDEX.set(key, result, expire=SEARCH.query_ttl)
+    return result
+
+
+def corpus_path(version: str) -> Path:
+    """Corpus file of a bible's version"""
+    return BIBLE_DATA_DIR / f"{version}.corpus"
+
+
+def download_dir(version: str) -> Path:
+    """Directory of the books downloaded so far, for a version being downloaded"""
+    return BIBLE_DATA_DIR / "download" / version
+
+
+def clean_text_key(version: str, book: str, chapter: int) -> Tuple[str, str, str, int]:
+    """Key of the clean text of a chapter, not read from a cleaned corpus"""
+    return ("clean_text", version, book, chapter)
+
+
+def load_corpus(version: str) -> Optional[Corpus]:
+    """
+    Memory-map the corpus file of a bible's version, once per process
+    :param version: bible's version, e.g kjv
+    :return: Corpus, or None if the version has not been stored
+    """
+    if version not in CORPORA:
+        if not corpus_path(version).exists():
+            return None
+        header, sections = read_corpus_file(corpus_path(version))
+        corpus = Corpus.from_sections(header, sections)
+        if "ngram_data" in sections:
+            NGRAM_INDEXES[version] = NgramIndex.from_sections(
+                header, sections, rows=corpus.chapter_keys()
+            )
+            VERSE_INDEXES[version] = VerseIndex.from_sections(
+                sections, vocabulary=NGRAM_INDEXES[version].vocabulary
+            )
+        CORPORA[version] = corpus
+    return CORPORA[version]
+
+
+def load_ngram_index(version: str) -> Optional[NgramIndex]:
+    """
+    Load the n-gram index of a bible's version, once per process
+    :param version: bible's version, e.g kjv
+    :return: NgramIndex, or None if it has not been built
+    """
+    load_corpus(version)
+    return NGRAM_INDEXES.get(version)
+
+
+def load_verse_index(version: str) -> Optional[VerseIndex]:
+    """
+    Load the verse index of a bible's version, once per process
+    :param version: bible's version, e.g kjv
+    :return: VerseIndex, or None if it has not been built
+    """
+    load_corpus(version)
+    return VERSE_INDEXES.get(version)
+
 
+@dataclass(frozen=True)
+class Hit:
+    """A book, chapter or verse found by a search"""
 
-class BibleNotFound(Exception):
-    pass
+    book: BookName
+    score: SimRatio
+    chapter: Optional[ChapterNum] = None
+    verse: Optional[int] = None
+    # Set by a search of several versions
+    version: Optional[str] = None
 
 
 @dataclass
@@ -49,7 +218,7 @@ class Verse:
 
     def clean_text(self) -> str:
         return normalize_text(
-            index_name=BIBLE_INDEX,
+            index_name=TEXT_INDEX,
             text=self.text,
             spacy_model=LANGUAGE_TO_MODEL[self.language],
         )
@@ -59,17 +228,68 @@ class Verse:
 class Chapter:
     number: int
     language: str
+    # Corpus and row of the chapter, verses are then read from the corpus
+    _corpus = None
+    _row = -1
+    # Key of the clean text in TEXT_INDEX, for a chapter of a bible's version
+    _key = None
+    # Joined and clean text, until a verse is added
+    _text = None
+    _clean_text = None
+    # Number of verses added, for the book's cached text
+    _revision = 0
 
     def __post_init__(self):
         self._verses = {}
 
+    @classmethod
+    def from_corpus(cls, corpus: Corpus, row: int) -> "Chapter":
+        chapter = cls(number=corpus.chapter_numbers[row], language=corpus.language)
+        chapter._corpus, chapter._row = corpus, row
+        return chapter
+
+    def __getstate__(self) -> Dict:
+        # Cached texts are computed again, they are not part of the chapter
+        state = self.__dict__.copy()
+        for name in ("_text", "_clean_text", "_revision"):
+            state.pop(name, None)
+        return state
+
     def add_verse(self, verse: Verse):
+        if self._corpus is not None:
+            # Copy the verses out of the read-only corpus before adding one
+            self._verses = {verse.number: verse for verse in self.verses}
+            self._corpus = None
         if verse.number not in self._verses:
             self._verses[verse.number] = Verse(
                 number=verse.number, text=verse.text, language=self.language
             )
+            self._invalidate()
+
+    def _invalidate(self) -> None:
+        """Drop the cached texts of a changed chapter, persisted ones included"""
+        # The persisted clean text is dropped on the first change, then only once
+        # stored again, not for every verse of a chapter being filled
+        if self._key is not None and (
+            self._revision == 0 or self._clean_text is not None
+        ):
+            TEXT_INDEX.pop(self._key, None)
+        self._text = self._clean_text = None
+        self._revision += 1
+
+    def _corpus_verse(self, verse_row: int) -> Verse:
+        return Verse(
+            number=self._corpus.verse_numbers[verse_row],
+            text=self._corpus.verse_text(verse_row),
+            language=self.language,
+        )
 
     def verse(self, verse_number: int) -> Optional[Verse]:
+        if self._corpus is not None:
+            for verse_row in self._corpus.verse_rows(self._row):
+                if self._corpus.verse_numbers[verse_row] == verse_number:
+                    return self._corpus_verse(verse_row)
+            return None
         try:
             return self._verses.get(verse_number)
         except KeyError:
@@ -78,46 +298,120 @@ class Chapter:
     @property
     def text(self) -> str:
         """Concatenate all verses for a given chapter number"""
-        return " ".join([verse.text.strip() for verse in self._verses.values()])
+        if self._corpus is not None:
+            return self._corpus.chapter_text(self._row)
+        if self._text is None:
+            self._text = " ".join(
+                [verse.text.strip() for verse in self._verses.values()]
+            )
+        return self._text
 
     @property
     def num_verse(self) -> int:
+        if self._corpus is not None:
+            return len(self._corpus.verse_rows(self._row))
         return len(self._verses.keys())
 
     @property
     def verses(self) -> List[Verse]:
+        if self._corpus is not None:
+            return [
+                self._corpus_verse(verse_row)
+                for verse_row in self._corpus.verse_rows(self._row)
+            ]
         return list(self._verses.values())
 
     def clean_text(self) -> str:
-        return normalize_text(
-            text=self.text,
-            spacy_model=LANGUAGE_TO_MODEL[self.language],
-            index_name=BIBLE_INDEX,
-        )
+        if self._corpus is not None and self._corpus.has_clean_text:
+            return self._corpus.chapter_clean_text(self._row)
+        if self._clean_text is None:
+            # Read without joining and hashing the text
+            if self._key is not None:
+                self._clean_text = TEXT_INDEX.get(self._key)
+            if self._clean_text is None:
+                self._clean_text = normalize_text(
+                    text=self.text,
+                    spacy_model=LANGUAGE_TO_MODEL[self.language],
+                    index_name=TEXT_INDEX,
+                    key=self._key,
+                )
+        return self._clean_text
+
+    def lemma_counts(self, k: Optional[int] = None) -> Dict[str, int]:
+        """
+        Lemma to count of the chapter, read from the corpus when counted there
+        :param k: number of lemmas, the most frequent first, default to all
+        :return: lemma to count, the most frequent first
+        """
+        if self._corpus is not None and self._corpus.has_lemma_counts:
+            return self._corpus.chapter_lemma_counts(self._row, k)
+        return lemma_counts(self.clean_text(), k)
 
     def compute_sim(
-        self, text: str, func: Callable[[str, str], float] = cosine_sim
+        self,
+        query: Union[str, Query],
+        func: Callable[[str, str], float] = cosine_sim,
     ) -> float:
-        query_clean_text = normalize_text(
-            text=text,
-            spacy_model=LANGUAGE_TO_MODEL[self.language],
-            index_name=BIBLE_INDEX,
-        )
-        return func(query_clean_text, self.clean_text())
-        # return func(text, self.clean_text())
+        query = prepare_query(query, language=self.language)
+        return func(query.clean_text, self.clean_text())
 
 
 @dataclass
 class Book:
     name: str
     language: str
+    version: Optional[str] = None
+    # Corpus and row of the book, chapters are then read from the corpus
+    _corpus = None
+    _row = -1
+    # Revision of the chapters, joined text and clean text last computed
+    _text_cache = ((), "", None)
 
     def __post_init__(self):
-        self._chapters = {}
+        # None for a chapter of the corpus, until it is accessed
+        self._chapters: Dict[int, Optional[Chapter]] = {}
+
+    @classmethod
+    def from_corpus(cls, corpus: Corpus, row: int, version: str) -> "Book":
+        book = cls(
+            name=corpus.book_names[row], language=corpus.language, version=version
+        )
+        book._corpus, book._row = corpus, row
+        book._chapter_rows = {
+            corpus.chapter_numbers[chapter_row]: chapter_row
+            for chapter_row in corpus.chapter_rows(row)
+        }
+        book._chapters = dict.fromkeys(book._chapter_rows)
+        return book
+
+    def __getstate__(self) -> Dict:
+        # Chapters of the corpus are read back from the stored version
+        state = self.__dict__.copy()
+        state.pop("_text_cache", None)
+        if state.pop("_corpus", None) is not None:
+            state["_chapters"] = {
+                chapter_number: None
+                if chapter is None or chapter._corpus is not None
+                else chapter
+                for chapter_number, chapter in self._chapters.items()
+            }
+        return state
+
+    def __setstate__(self, state: Dict):
+        self.__dict__.update(state)
+        if "_chapter_rows" in state:
+            self._corpus = load_corpus(self.version)
 
     def chapter(self, chapter_number: int) -> Chapter:
-        if chapter_number not in self._chapters:
-            chapter = Chapter(number=chapter_number, language=self.language)
+        if self._chapters.get(chapter_number) is None:
+            if chapter_number not in self._chapters:
+                chapter = Chapter(number=chapter_number, language=self.language)
+            else:
+                chapter = Chapter.from_corpus(
+                    self._corpus, self._chapter_rows[chapter_number]
+                )
+            if self.version is not None:
+                chapter._key = clean_text_key(self.version, self.name, chapter_number)
             self._chapters[chapter_number] = chapter
         return self._chapters[chapter_number]
 
@@ -125,74 +419,231 @@ class Book:
     def num_chapter(self):
         return len(self._chapters.keys())
 
+    @property
+    def chapter_numbers(self) -> List[int]:
+        return list(self._chapters.keys())
+
     @property
     def chapters(self) -> List[Chapter]:
-        return list(self._chapters.values())
+        return [self.chapter(chapter_number) for chapter_number in self._chapters]
 
     @property
     def text(self) -> str:
         """Returns all the text given its book's name"""
-        return " ".join([chapter.text.strip() for chapter in self._chapters.values()])
+        if self._corpus is not None and self._is_unchanged():
+            return self._corpus.book_text(self._row)
+        return self._cached_text()[0]
 
-    def clean_text(self) -> str:
-        return normalize_text(
-            text=self.text,
-            spacy_model=LANGUAGE_TO_MODEL[self.language],
-            index_name=BIBLE_INDEX,
+    def _revision(self) -> Tuple:
+        """Changes whenever a chapter is added, replaced or changed"""
+        return tuple(
+            (chapter_number, id(chapter), chapter._revision if chapter else 0)
+            for chapter_number, chapter in self._chapters.items()
         )
 
+    def _cached_text(self) -> Tuple[str, Optional[str]]:
+        """Joined text and clean text, if computed, of the current chapters"""
+        revision = self._revision()
+        if self._text_cache[0] != revision:
+            text = " ".join([chapter.text.strip() for chapter in self.chapters])
+            # The chapters read from the corpus are only now created
+            self._text_cache = (self._revision(), text, None)
+        return self._text_cache[1], self._text_cache[2]
+
+    def _is_unchanged(self) -> bool:
+        """Whether all chapters are still read from the corpus"""
+        return len(self._chapters) == len(self._chapter_rows) and all(
+            chapter is None or chapter._corpus is not None
+            for chapter in self._chapters.values()
+        )
+
+    def clean_text(self) -> str:
+        if self._corpus is not None and self._corpus.has_clean_text:
+            if self._is_unchanged():
+                return self._corpus.book_clean_text(self._row)
+        text, clean_text = self._cached_text()
+        if clean_text is None:
+            clean_text = normalize_text(
+                text=text,
+                spacy_model=LANGUAGE_TO_MODEL[self.language],
+                index_name=TEXT_INDEX,
+            )
+            self._text_cache = self._text_cache[:2] + (clean_text,)
+        return clean_text
+
+    def lemma_counts(self, k: Optional[int] = None) -> Dict[str, int]:
+        """
+        Lemma to count of the book, read from the corpus when counted there
+        :param k: number of lemmas, the most frequent first, default to all
+        :return: lemma to count, the most frequent first
+        """
+        if self._corpus is not None and self._corpus.has_lemma_counts:
+            if self._is_unchanged():
+                return self._corpus.book_lemma_counts(self._row, k)
+        return lemma_counts(self.clean_text(), k)
+
+    def top_terms(
+        self, k: int = 10, chapter_numbers: Optional[Iterable[int]] = None
+    ) -> List[Tuple[str, int]]:
+        """
+        Most frequent lemmas of the book, or of some of its chapters
+        :param k: number of lemmas
+        :param chapter_numbers: chapters, e.g range(1, 4), default to the whole book
+        :return: (lemma, count) pairs, the most frequent first
+        """
+        if chapter_numbers is None:
+            return list(self.lemma_counts(k).items())
+        chapter_numbers = set(chapter_numbers)
+        counts: Counter = Counter()
+        for chapter in self.chapters:
+            if chapter.number in chapter_numbers:
+                counts.update(chapter.lemma_counts())
+        return counts.most_common(k)
+
     def compute_sim(
-        self, text: str, func: Callable[[str, str], float] = cosine_sim
+        self,
+        query: Union[str, Query],
+        func: Callable[[str, str], float] = cosine_sim,
     ) -> float:
-        query_clean_text = normalize_text(
-            text=text,
-            spacy_model=LANGUAGE_TO_MODEL[self.language],
-            index_name=BIBLE_INDEX,
-        )
-        return func(query_clean_text, self.clean_text())
+        query = prepare_query(query, language=self.language)
+        return func(query.clean_text, self.clean_text())
 
     @staticmethod
     def compute_chapter_to_similarity(
-        chapter: Chapter, text: str
+        chapter: Chapter, query: Union[str, Query]
     ) -> Dict[ChapterNum, SimRatio]:
-        return {chapter.number: chapter.compute_sim(text)}
+        return {chapter.number: chapter.compute_sim(query)}
 
-    @SEARCH_CACHE.memoize()
-    def chapter_to_similarity(self, text: str) -> Dict[int, float]:
-        """Sorted chapter to similarity from highest to lowest score"""
-        chapter_to_similarity = {
-            chapter.number: chapter.compute_sim(text) for chapter in self.chapters
-        }
-        return sort_dict(chapter_to_similarity, by="value")
+    def chapter_to_similarity(
+        self, query: Union[str, Query], scoring: str = DEFAULT_SCORING
+    ) -> Dict[int, float]:
+        """
+        Sorted chapter to similarity from highest to lowest score
+        :param query: query text, or prepared query
+        :param scoring: name of the scoring, see `scoring.SCORINGS`
+        :return: chapter number to similarity ratio
+        """
+        query = prepare_query(query, language=self.language)
+        ngram_index = load_ngram_index(self.version) if self.version else None
+        if ngram_index is None:
+            # Chapters of a book being built, scored at once and not cached
+            chapters = self.chapters
+            ratios = score_texts(
+                query.clean_text,
+                [chapter.clean_text() for chapter in chapters],
+                scoring=scoring,
+            )
+            chapter_to_similarity = {
+                chapter.number: float(ratio) for chapter, ratio in zip(chapters, ratios)
+            }
+            return sort_dict(chapter_to_similarity, by="value")
+
+        def compute() -> Dict[int, float]:
+            book_rows = ngram_index.book_rows(self.name)
+            scores = ngram_index.scores(query, scoring=scoring)
+            chapter_to_similarity = {
+                chapter_num: float(ratio)
+                for (_, chapter_num), ratio in zip(
+                    ngram_index.rows[book_rows], scores[book_rows]
+                )
+            }
+            return sort_dict(chapter_to_similarity, by="value")
+
+        key = search_key(
+            "chapter_to_similarity",
+            self.version,
+            self.language,
+            scoring,
+            self.name,
+            query.clean_text,
+            ngram_index.build_id,
+        )
+        return cached_search(key, compute)
 
 
 @dataclass
 class Bible:
     version: str
     language: str
-    BASE_URL: ClassVar[str] = "https://getbible.net/json"
+    # Directory or archive of per-book JSON files to import, instead of downloading
+    source: InitVar[Optional[Path]] = None
+    BASE_URL: ClassVar[str] = BASE_URL
+    # Number of books downloaded at once
+    DOWNLOAD_WORKERS: ClassVar[int] = 8
+    # Number of spacy processes to clean the text, more than 1 needs spacy>=2.2
+    CLEAN_N_PROCESS: ClassVar[int] = 1
+    # Number of worker processes of the search executor
+    SEARCH_WORKERS: ClassVar[int] = os.cpu_count() or 1
+    # Number of books scored per step of a progressive search
+    SEARCH_STEP_BOOKS: ClassVar[int] = 11
 
-    def __post_init__(self):
+    def __post_init__(self, source: Optional[Path]):
         self._books: Dict[str, Book] = {}
-        index_name = self.version
-        if self.version in BIBLE_INDEX:
-            self._books = BIBLE_INDEX[self.version]
-            return
-        # Retrieving from BASE_URL and populate books
-        # BOOKS = ['genesis', 'psalms']
-        print(f"Downloading bible version: {self.version}...")
-        for book in BOOKS:
-            chapter_to_verse: Dict = Bible.retrieve_chapter_to_verse(
-                book, version=self.version
-            )
-            self.populate_book(book, chapter_to_verse)
-            BIBLE_INDEX[index_name] = self._books
+        self._corpus: Optional[Corpus] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_workers = 0
+        if source is not None:
+            print(f"Importing bible version: {self.version} from {source}...")
+            self.import_books(source)
+        else:
+            if not corpus_path(self.version).exists() and self.version in BIBLE_INDEX:
+                self.migrate_books()
+            try:
+                corpus = load_corpus(self.version)
+            except CorpusFormatError as error:
+                # Either imported or downloaded, the version is rebuilt by the user
+                raise CorpusFormatError(
+                    f"{error}. Import {self.version} again with Bible.from_files, "
+                    f"or remove the file and preload {self.version} again"
+                ) from error
+            if corpus is not None:
+                self.open_corpus(corpus)
+                return
+            # Retrieving from BASE_URL and populate books
+            print(f"Downloading bible version: {self.version}...")
+            self.download()
         print(f"Cleaning text....")
         self.clean_text()
+        # Stored in the corpus file, the downloaded books are not needed anymore
+        shutil.rmtree(download_dir(self.version), ignore_errors=True)
+        print(f"Indexing text....")
+        self.build_ngram_index()
+
+    @classmethod
+    def from_files(cls, version: str, language: str, path: Path) -> "Bible":
+        """
+        Import a bible's version from local per-book JSON files, without network.
+        The books are read one at a time, then the text is cleaned and indexed.
+        An already stored version is replaced.
+        :param version: bible's version, e.g kjv
+        :param language: language of the version, e.g EN
+        :param path: directory or zip/tar archive of <book>.json files
+        :return: Bible
+        """
+        return cls(version=version, language=language, source=Path(path))
+
+    def __getstate__(self) -> Dict:
+        # A running executor stays with the process that started it,
+        # the corpus is memory-mapped again from its file
+        state = self.__dict__.copy()
+        state["_executor"] = None
+        state["_executor_workers"] = 0
+        state["_corpus"] = None
+        return state
+
+    def __setstate__(self, state: Dict):
+        self.__dict__.update(state)
+        self._corpus = load_corpus(self.version)
+
+    def __enter__(self) -> "Bible":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
 
     def book(self, name: str) -> Book:
         if name not in self._books:
-            book = Book(name=name, language=self.language)
+            book = Book(name=name, language=self.language, version=self.version)
             self._books[name] = book
         return self._books[name]
 
@@ -211,20 +662,41 @@ class Bible:
         :param kwargs: parameters passed to the URL
         :return: a dictionary of chapter to verses
         """
+        return BookDownloader(base_url=Bible.BASE_URL).retrieve(book, **kwargs)
+
+    def import_books(self, path: Path) -> None:
+        """
+        Populate the books from local per-book JSON files
+        :param path: directory or zip/tar archive of <book>.json files
+        :return: None
+        """
+        for book, chapter_to_verse in read_books(path):
+            self.populate_book(book, chapter_to_verse)
+        if not self._books:
+            raise BibleNotFound(f"No books found in {path}")
+        self.open_corpus(self.build_corpus())
 
-        params = dict(p=book, **kwargs)
-        resp = requests.get(url=Bible.BASE_URL, params=params)
-        # The first character to skip is '(' and the last two characters ');'
-        clean_text = resp.text[1:-2]
-        # NULL parsed as a single 'U'
-        if clean_text == "U":
-            raise BibleNotFound(f"NULL result. PARAMS={params}.")
+    def download(self, books: Optional[List[str]] = None) -> None:
+        """
+        Download the books concurrently and populate them.
+        Downloaded books are kept until the corpus is stored,
+        so an interrupted download resumes where it stopped.
+        :param books: names of the books, default to all BOOKS
+        :return: None
+        """
+        books = books or BOOKS
+        downloaded_books = Index(str(download_dir(self.version)))
+        downloader = BookDownloader(
+            base_url=Bible.BASE_URL, workers=Bible.DOWNLOAD_WORKERS
+        )
         try:
-            book_to_chapter: Dict = json.loads(clean_text)["book"]
-        except KeyError:
-            raise BibleNotFound(f"Error Book loaded. PARAMS={params}")
-        else:
-            return book_to_chapter
+            downloader.download(books, downloaded_books, version=self.version)
+        except BibleNotFound:
+            shutil.rmtree(download_dir(self.version), ignore_errors=True)
+            raise
+        for book in books:
+            self.populate_book(book, downloaded_books[book])
+        self.open_corpus(self.build_corpus())
 
     def populate_book(self, book: str, chapter_to_verse: Dict) -> None:
         """
@@ -240,49 +712,199 @@ class Bible:
                 verse = Verse(int(verse_num), verse_text, self.language)
                 self.book(book).chapter(int(chapter_num)).add_verse(verse)
 
-    # @staticmethod
-    # def clean_textbook(book: Book):
-    #     book.clean_text()
-    #     for chapter in book.chapters:
-    #         chapter.clean_text()
-    #         for verse in chapter.verses:
-    #             verse.clean_text()
+    def open_corpus(self, corpus: Corpus) -> None:
+        """Read the books from a corpus, chapters and verses are read on access"""
+        self._corpus = corpus
+        self._books = {
+            name: Book.from_corpus(corpus, row, version=self.version)
+            for row, name in enumerate(corpus.book_names)
+        }
+
+    def build_corpus(self) -> Corpus:
+        """
+        Build one compact corpus from the populated books
+        :return: Corpus
+        """
+        return Corpus.build(
+            language=self.language,
+            rows=(
+                (book.name, chapter.number, verse.number, verse.text)
+                for book in self.books
+                for chapter in book.chapters
+                for verse in chapter.verses
+            ),
+        )
+
+    def store_corpus(
+        self,
+        ngram_index: Optional[NgramIndex] = None,
+        verse_index: Optional[VerseIndex] = None,
+    ) -> None:
+        """
+        Write the corpus, with its clean text and indexes if any,
+        to the version's corpus file and memory-map it back
+        :param ngram_index: n-gram index of the corpus' chapters
+        :param verse_index: inverted index of the corpus' verses
+        :return: None
+        """
+        header, sections = self._corpus.to_sections()
+        for index in (ngram_index, verse_index):
+            if index is not None:
+                index_header, index_sections = index.to_sections()
+                header.update(index_header)
+                sections.update(index_sections)
+        write_corpus_file(corpus_path(self.version), header, sections)
+        CORPORA.pop(self.version, None)
+        NGRAM_INDEXES.pop(self.version, None)
+        VERSE_INDEXES.pop(self.version, None)
+        self.open_corpus(load_corpus(self.version))
+
+    def migrate_books(self) -> None:
+        """Write a version's books, stored in BIBLE_INDEX before, to a corpus file"""
+        self._books = BIBLE_INDEX[self.version]
+        corpus = self.build_corpus()
+        self.open_corpus(corpus)
+        # Clean texts of the verses were cached in BIBLE_INDEX too
+        verse_keys = {
+            text_key(corpus.verse_text(verse_row))
+            for verse_row in range(len(corpus.verse_numbers))
+        }
+        set_many(TEXT_INDEX, get_many(BIBLE_INDEX, verse_keys).items())
+        self.clean_text()
+        self.build_ngram_index()
+        BIBLE_INDEX.pop(self.version, None)
+
+    def clean_text(self, batch_size: int = 1000, n_process: Optional[int] = None):
+        """
+        Clean the text of every verse of the corpus in batches,
+        chapters and books are cleaned by joining their cleaned verses
+        :param batch_size: number of verses per spacy batch
+        :param n_process: number of spacy processes, default to CLEAN_N_PROCESS
+        :return: None
+        """
+        corpus = self._corpus
+        verse_texts = (
+            corpus.verse_text(verse_row)
+            for verse_row in range(len(corpus.verse_numbers))
+        )
+        clean_verse_texts = normalize_texts(
+            verse_texts,
+            spacy_model=LANGUAGE_TO_MODEL[self.language],
+            index_name=TEXT_INDEX,
+            batch_size=batch_size,
+            n_process=n_process or Bible.CLEAN_N_PROCESS,
+        )
+        corpus.add_clean_text(clean_verse_texts)
+        # The n-gram index of the former clean text is dropped
+        self.store_corpus()
 
-    def clean_text(self):
+    def build_ngram_index(self) -> NgramIndex:
+        """
+        Build the n-gram index from the cleaned chapters' text,
+        and the inverted index of the verses over its n-grams,
+        and store them in the corpus file
+        :return: NgramIndex
+        """
+        rows, texts = [], []
         for book in self.books:
-            book.clean_text()
             for chapter in book.chapters:
-                chapter.clean_text()
-                for verse in chapter.verses:
-                    verse.clean_text()
+                rows.append((book.name, chapter.number))
+                texts.append(chapter.clean_text())
+        ngram_index = NgramIndex.build(rows, texts)
+        corpus = self._corpus
+        verse_index = VerseIndex.build(
+            ngram_index.vocabulary,
+            [
+                corpus.verse_clean_text(verse_row)
+                for verse_row in range(len(corpus.verse_numbers))
+            ],
+        )
+        self.store_corpus(ngram_index, verse_index)
+        return load_ngram_index(self.version)
 
-        # pool = Pool()
-        # pool.map(Bible.clean_textbook, self.books)
-        # pool.close()
-        # pool.join()
+    @property
+    def ngram_index(self) -> NgramIndex:
+        ngram_index = load_ngram_index(self.version)
+        if ngram_index is None:
+            ngram_index = self.build_ngram_index()
+        return ngram_index
 
-    @staticmethod
-    def compute_book_to_similarity(book: Book, text: str) -> Dict[BookName, SimRatio]:
-        chapter_to_similarity = book.chapter_to_similarity(text)
-        chapter_ratios = list(chapter_to_similarity.values())
-        top_chapter_ratio = chapter_ratios[0]
-        # Every book is represented by the highest chapter ratio's
-        return {book.name: top_chapter_ratio}
+    @property
+    def verse_index(self) -> VerseIndex:
+        return load_verse_index(self.version)
 
-    @SEARCH_CACHE.memoize()
-    def book_to_similarity(self, text: str) -> Dict[BookName, SimRatio]:
+    def prepare_query(self, text: str) -> Query:
+        """Normalize and vectorize a query text in the bible's language"""
+        return prepare_query(text, language=self.language)
 
-        # book_to_similarity = {}
-        # for book in self.books:
-        #     chapter_to_similarity = book.chapter_to_similarity(text)
-        #     stats_chapter_similarity = list(chapter_to_similarity.values())[0]
-        #     book_to_similarity[book.name] = stats_chapter_similarity
+    def book_to_similarity(
+        self, query: Union[str, Query], scoring: str = DEFAULT_SCORING
+    ) -> Dict[BookName, SimRatio]:
+        query = self.prepare_query(query)
+        ngram_index = self.ngram_index
+        return cached_search(
+            self._book_to_similarity_key(query, ngram_index, scoring),
+            lambda: self._book_to_similarity(
+                ngram_index.scores(query, scoring=scoring), ngram_index
+            ),
+        )
 
-        compute_text = partial(Bible.compute_book_to_similarity, text=text)
-        with Pool() as pool:
-            res: List[Dict[BookName, SimRatio]] = pool.map(compute_text, self.books)
+    def iter_book_to_similarity(
+        self, query: Union[str, Query], scoring: str = DEFAULT_SCORING
+    ) -> Iterator[Tuple[float, Dict[BookName, SimRatio]]]:
+        """
+        Book to similarity of a query, scored SEARCH_STEP_BOOKS books at a time,
+        e.g to show partial results and stop between steps
+        :param query: query text, or prepared query
+        :param scoring: name of the scoring, see `scoring.SCORINGS`
+        :return: yields the fraction of books scored and the book to similarity
+                 of the books scored so far, the last one being book_to_similarity
+        """
+        query = self.prepare_query(query)
+        ngram_index = self.ngram_index
+        key = self._book_to_similarity_key(query, ngram_index, scoring)
+        book_to_similarity = SEARCH_INDEX.get(key)
+        if book_to_similarity is not None:
+            yield 1.0, book_to_similarity
+            return
+        book_names = ngram_index.book_names
+        scores = np.zeros(len(ngram_index.rows))
+        for start in range(0, len(book_names), Bible.SEARCH_STEP_BOOKS):
+            end = min(start + Bible.SEARCH_STEP_BOOKS, len(book_names))
+            rows = slice(
+                ngram_index.book_rows(book_names[start]).start,
+                ngram_index.book_rows(book_names[end - 1]).stop,
+            )
+            scores[rows] = ngram_index.scores(query, scoring=scoring, rows=rows)
+            if end < len(book_names):
+                yield end / len(book_names), self._book_to_similarity(
+                    scores, ngram_index
+                )
+        book_to_similarity = self._book_to_similarity(scores, ngram_index)
+        SEARCH_INDEX.set(key, book_to_similarity, expire=SEARCH.query_ttl)
+        yield 1.0, book_to_similarity
+
+    def _book_to_similarity_key(
+        self, query: Query, ngram_index: NgramIndex, scoring: str
+    ) -> Tuple:
+        return search_key(
+            "book_to_similarity",
+            self.version,
+            self.language,
+            scoring,
+            query.clean_text,
+            ngram_index.build_id,
+        )
 
-        book_to_similarity = dict(ChainMap(*res))
+    def _book_to_similarity(
+        self, scores: np.ndarray, ngram_index: NgramIndex
+    ) -> Dict[BookName, SimRatio]:
+        # Every book is represented by the highest chapter ratio's
+        book_scores = ngram_index.book_scores(scores)
+        book_to_similarity = {
+            book_name: float(score)
+            for book_name, score in zip(ngram_index.book_names, book_scores)
+        }
         normalized_book_to_similarity = normalize(
             sort_dict(book_to_similarity, by="value")
         )
@@ -291,3 +913,332 @@ class Bible:
             b: r for b, r in normalized_book_to_similarity.items() if r > 0.0
         }
         return filtered_book_to_similarity
+
+    def search(
+        self,
+        query: Union[str, Query],
+        k: int = 10,
+        level: str = "book",
+        scoring: str = DEFAULT_SCORING,
+    ) -> List[Hit]:
+        """
+        The k best books, chapters or verses of a query, without ranking the others
+        :param query: query text, or prepared query
+        :param k: number of hits
+        :param level: book, chapter or verse
+        :param scoring: name of the scoring, see `scoring.SCORINGS`
+        :return: hits from the highest score, with a score > 0
+        """
+        if level not in SEARCH_LEVELS:
+            raise ValueError(f"Search level not in {SEARCH_LEVELS}: {level}")
+        scorer_class(scoring)
+        query = self.prepare_query(query)
+        ngram_index = self.ngram_index
+        key = search_key(
+            "search",
+            self.version,
+            self.language,
+            level,
+            scoring,
+            k,
+            query.clean_text,
+            ngram_index.build_id,
+        )
+        return cached_search(
+            key, lambda: self._search(query, k, level, ngram_index, scoring)
+        )
+
+    def _search(
+        self,
+        query: Query,
+        k: int,
+        level: str,
+        ngram_index: NgramIndex,
+        scoring: str = DEFAULT_SCORING,
+    ) -> List[Hit]:
+        if level == "verse":
+            return self._search_verses(query, k, ngram_index, scoring)
+        if level == "book":
+            books, scores = ngram_index.top_rows(
+                query, k, groups=ngram_index.row_books, scoring=scoring
+            )
+            return [
+                Hit(book=ngram_index.book_names[book], score=float(score))
+                for book, score in zip(books, scores)
+            ]
+        hits = []
+        for row, score in zip(*ngram_index.top_rows(query, k, scoring=scoring)):
+            book_name, chapter_num = ngram_index.rows[row]
+            hits.append(Hit(book=book_name, chapter=chapter_num, score=float(score)))
+        return hits
+
+    def _search_verses(
+        self,
+        query: Query,
+        k: int,
+        ngram_index: NgramIndex,
+        scoring: str = DEFAULT_SCORING,
+    ) -> List[Hit]:
+        """The k best verses, of the verses sharing an n-gram with the query"""
+        verse_rows, scores = self.verse_index.top_verses(query, k, scoring=scoring)
+        corpus = self._corpus
+        chapter_ends = np.asarray(corpus.chapter_verses)[1:]
+        hits = []
+        for verse_row, score in zip(verse_rows, scores):
+            chapter_row = int(np.searchsorted(chapter_ends, verse_row, side="right"))
+            book_name, chapter_num = ngram_index.rows[chapter_row]
+            hits.append(
+                Hit(
+                    book=book_name,
+                    chapter=chapter_num,
+                    verse=corpus.verse_numbers[verse_row],
+                    score=float(score),
+                )
+            )
+        return hits
+
+    def verse_to_similarity(
+        self,
+        query: Union[str, Query],
+        book_name: BookName,
+        chapter_num: int,
+        scoring: str = DEFAULT_SCORING,
+    ) -> Dict[int, SimRatio]:
+        """
+        Similarity of the verses of a chapter sharing an n-gram with a query
+        :param query: query text, or prepared query
+        :param book_name: book's name
+        :param chapter_num: chapter's number
+        :param scoring: name of the scoring, see `scoring.SCORINGS`
+        :return: verse number to similarity ratio, from the highest
+        """
+        scorer_class(scoring)
+        query = self.prepare_query(query)
+        ngram_index = self.ngram_index
+        key = search_key(
+            "verse_to_similarity",
+            self.version,
+            self.language,
+            scoring,
+            book_name,
+            chapter_num,
+            query.clean_text,
+            ngram_index.build_id,
+        )
+        return cached_search(
+            key,
+            lambda: self._verse_to_similarity(query, book_name, chapter_num, scoring),
+        )
+
+    def _verse_to_similarity(
+        self, query: Query, book_name: BookName, chapter_num: int, scoring: str
+    ) -> Dict[int, SimRatio]:
+        corpus = self._corpus
+        chapter_rows = (
+            corpus.chapter_rows(corpus.book_names.index(book_name))
+            if book_name in corpus.book_names
+            else range(0)
+        )
+        chapter_row = next(
+            (row for row in chapter_rows if corpus.chapter_numbers[row] == chapter_num),
+            None,
+        )
+        if chapter_row is None:
+            raise ValueError(
+                f"No chapter {chapter_num} of {book_name} in {self.version}"
+            )
+        verse_rows = corpus.verse_rows(chapter_row)
+        # Only the chapter's verses are scored
+        rows, scores = self.verse_index.scores(
+            query, scoring=scoring, rows=slice(verse_rows.start, verse_rows.stop)
+        )
+        verse_to_similarity = {
+            corpus.verse_numbers[verse_row]: float(score)
+            for verse_row, score in zip(rows, scores)
+        }
+        return sort_dict(verse_to_similarity, by="value")
+
+    def search_executor(self, workers: Optional[int] = None) -> ProcessPoolExecutor:
+        """
+        Long-lived worker processes, each loading the bible and its index once.
+        A running executor of another number of workers is restarted.
+        :param workers: number of worker processes, default to SEARCH_WORKERS
+                        or to those of the running executor
+        :return: ProcessPoolExecutor
+        """
+        if workers is not None and workers != self._executor_workers:
+            self.close()
+        if self._executor is None:
+            # Build the index once, instead of in every worker
+            self.ngram_index
+            self._executor_workers = workers or Bible.SEARCH_WORKERS
+            self._executor = ProcessPoolExecutor(
+                max_workers=self._executor_workers,
+                initializer=init_search_worker,
+                initargs=(self.version, self.language),
+            )
+        return self._executor
+
+    def book_to_similarity_many(
+        self,
+        texts: List[str],
+        workers: Optional[int] = None,
+        scoring: str = DEFAULT_SCORING,
+    ) -> List[Dict[BookName, SimRatio]]:
+        """
+        Run many searches on the search executor, only the queries are sent.
+        With one worker, the queries not cached are scored in this process
+        with one sparse product.
+        :param texts: query texts
+        :param workers: number of worker processes, see `search_executor`
+        :param scoring: name of the scoring, see `scoring.SCORINGS`
+        :return: book to similarity of every query, in the same order
+        """
+        scorer_class(scoring)
+        if workers == 1:
+            return self._book_to_similarity_batch(
+                [self.prepare_query(text) for text in texts], scoring
+            )
+        executor = self.search_executor(workers=workers)
+        return list(executor.map(search_book_to_similarity, texts, repeat(scoring)))
+
+    def _book_to_similarity_batch(
+        self, queries: List[Query], scoring: str
+    ) -> List[Dict[BookName, SimRatio]]:
+        ngram_index = self.ngram_index
+        keys = [
+            self._book_to_similarity_key(query, ngram_index, scoring)
+            for query in queries
+        ]
+        key_to_result = get_many(SEARCH_INDEX, keys)
+        missing = [i for i, key in enumerate(keys) if key not in key_to_result]
+        scores = ngram_index.scores_many([queries[i] for i in missing], scoring=scoring)
+        for i, query_scores in zip(missing, scores):
+            result = self._book_to_similarity(query_scores, ngram_index)
+            SEARCH_INDEX.set(keys[i], result, expire=SEARCH.query_ttl)
+            key_to_result[keys[i]] = result
+        return [key_to_result[key] for key in keys]
+
+    def close(self) -> None:
+        """Shutdown the search executor, if any"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+def init_search_worker(version: str, language: str) -> None:
+    global WORKER_BIBLE
+    WORKER_BIBLE = Bible(version=version, language=language)
+    load_ngram_index(version)
+    # Every query is normalized, load the model before the first one
+    preload_models(language)
+
+
+def search_book_to_similarity(
+    text: str, scoring: str = DEFAULT_SCORING
+) -> Dict[BookName, SimRatio]:
+    return WORKER_BIBLE.book_to_similarity(text, scoring=scoring)
+
+
+def search_versions(
+    text: str,
+    bibles: Iterable[Bible],
+    k: int = 10,
+    level: str = "book",
+    scoring: str = DEFAULT_SCORING,
+    workers: Optional[int] = None,
+) -> Dict[str, List[Hit]]:
+    """
+    Search a query in several bible's versions at once, e.g to compare them.
+    The query is normalized once per language, and the prepared queries are
+    sent to the worker processes shared by all versions.
+    :param text: query text
+    :param bibles: bibles of the versions
+    :param k: number of hits per version
+    :param level: book, chapter or verse
+    :param scoring: name of the scoring, see `scoring.SCORINGS`
+    :param workers: number of worker processes, default to SEARCH_WORKERS,
+                    1 to search in this process
+    :return: version to its hits, from the highest score, see `merge_hits`
+    """
+    if level not in SEARCH_LEVELS:
+        raise ValueError(f"Search level not in {SEARCH_LEVELS}: {level}")
+    scorer_class(scoring)
+    bibles = list(bibles)
+    language_to_query: Dict[str, Query] = {}
+    for bible in bibles:
+        if bible.language not in language_to_query:
+            language_to_query[bible.language] = bible.prepare_query(text)
+        # Built once here, instead of by every worker
+        bible.ngram_index
+        if level == "verse":
+            bible.verse_index
+    workers = workers or Bible.SEARCH_WORKERS
+    if workers == 1 or len(bibles) == 1:
+        return {
+            bible.version: version_hits(
+                bible, language_to_query[bible.language], k, level, scoring
+            )
+            for bible in bibles
+        }
+    executor = shared_search_executor(workers=workers)
+    futures = [
+        executor.submit(
+            search_version,
+            bible.version,
+            bible.language,
+            language_to_query[bible.language],
+            k,
+            level,
+            scoring,
+        )
+        for bible in bibles
+    ]
+    return {bible.version: future.result() for bible, future in zip(bibles, futures)}
+
+
+def merge_hits(version_to_hits: Dict[str, List[Hit]]) -> List[Hit]:
+    """Hits of several versions in one ranking, from the highest score"""
+    return list(merge(*version_to_hits.values(), key=lambda hit: -hit.score))
+
+
+def version_hits(
+    bible: Bible, query: Query, k: int, level: str, scoring: str
+) -> List[Hit]:
+    hits = bible.search(query, k=k, level=level, scoring=scoring)
+    return [replace(hit, version=bible.version) for hit in hits]
+
+
+def shared_search_executor(workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """
+    Long-lived worker processes shared by the searches of all versions,
+    every worker loading a version the first time it searches it.
+    A running executor of another number of workers is restarted.
+    :param workers: number of worker processes, default to SEARCH_WORKERS
+                    or to those of the running executor
+    :return: ProcessPoolExecutor
+    """
+    global SHARED_EXECUTOR, SHARED_EXECUTOR_WORKERS
+    if workers is not None and workers != SHARED_EXECUTOR_WORKERS:
+        shutdown_shared_executor()
+    if SHARED_EXECUTOR is None:
+        SHARED_EXECUTOR_WORKERS = workers or Bible.SEARCH_WORKERS
+        SHARED_EXECUTOR = ProcessPoolExecutor(max_workers=SHARED_EXECUTOR_WORKERS)
+    return SHARED_EXECUTOR
+
+
+def shutdown_shared_executor() -> None:
+    """Shutdown the worker processes shared by all versions, if any"""
+    global SHARED_EXECUTOR
+    if SHARED_EXECUTOR is not None:
+        SHARED_EXECUTOR.shutdown(wait=True)
+        SHARED_EXECUTOR = None
+
+
+def search_version(
+    version: str, language: str, query: Query, k: int, level: str, scoring: str
+) -> List[Hit]:
+    key = (version, language)
+    if key not in WORKER_BIBLES:
+        WORKER_BIBLES[key] = Bible(version=version, language=language)
+    return version_hits(WORKER_BIBLES[key], query, k, level, scoring)
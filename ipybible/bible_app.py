@@ -1,15 +1,19 @@
 """Module for ipybible app"""
+import asyncio
 import ipyvuetify as v  # type: ignore
 import traitlets  # type: ignore
 import bqplot as bq  # type: ignore
 import pandas as pd  # type: ignore
 
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import List, Dict, ClassVar, Tuple
+from functools import partial
+from typing import List, Dict, ClassVar, Set, Tuple
 from bqplot.market_map import MarketMap  # type: ignore
 
 from ipybible.bible import Bible, Verse
-from ipybible.bible_cloud import generate_cloud
+from ipybible.bible_cloud import generate_cloud, update_cloud
+from ipybible.scoring import DEFAULT_SCORING, SCORINGS
 from ipybible.misc import count_words
 
 BookName = str
@@ -17,14 +21,46 @@ BookName = str
 SimRatio = float
 LANGUAGE_TO_VERSIONS = {"EN": ["kjv", "basicenglish"], "NL": ["statenvertaling"]}
 VERSION_TO_LANGUAGE = {"kjv": "EN", "statenvertaling": "NL", "basicenglish": "EN"}
+# Searches run one step at a time, off the kernel's event loop
+SEARCH_EXECUTOR = ThreadPoolExecutor(max_workers=1)
 
 
 def get_default_bible_version(language):
     return LANGUAGE_TO_VERSIONS[language][0]
 
 
+def update_barplot(barplot: bq.Figure, book_to_similarity: Dict[BookName, SimRatio]):
+    """Show another book to similarity in a bar plot, sending its data only"""
+    bar = barplot.marks[0]
+    with bar.hold_sync():
+        bar.x = list(book_to_similarity.keys())
+        bar.y = list(book_to_similarity.values())
+        bar.selected = [0]
+
+
+def similarity_frame(chapter_to_similarity: Dict[int, float]) -> pd.DataFrame:
+    """Reference data of a market map, the similarity of every chapter"""
+    return pd.DataFrame.from_dict(
+        chapter_to_similarity, orient="index", columns=["sim"]
+    )
+
+
+def update_market_map(
+    market_map: MarketMap, chapter_to_similarity: Dict[int, float], chapter: int
+):
+    """Show another chapter to similarity in a market map, sending its data only"""
+    with market_map.hold_sync():
+        market_map.names = list(chapter_to_similarity.keys())
+        market_map.color = list(chapter_to_similarity.values())
+        market_map.ref_data = similarity_frame(chapter_to_similarity)
+        market_map.selected = [chapter]
+
+
 class VerseList(v.VuetifyTemplate):
-    """Show a list of verses in a given chapter of a book from a bible's version"""
+    """
+    Show a list of verses in a given chapter of a book from a bible's version,
+    the verses similar to a search being highlighted
+    """
 
     items = traitlets.List([]).tag(sync=True)
     title = traitlets.Unicode("").tag(sync=True)
@@ -35,12 +71,12 @@ class VerseList(v.VuetifyTemplate):
           <v-card flat style="background: rgba(255,255,255,0);"
                   v-for="(item, index) in items">
             <v-card-text>
-              <v-badge left color="red">
+              <v-badge left :color="item.highlight ? 'orange' : 'red'">
                   <template v-slot:badge>
                     <span>{{ index + 1 }}</span>
                   </template>
-                  <span>
-                    {{ item }}
+                  <span :class="{ 'font-weight-bold': item.highlight }">
+                    {{ item.text }}
                    </span>
               </v-badge>
             </v-card-text>
@@ -49,16 +85,30 @@ class VerseList(v.VuetifyTemplate):
     """
     ).tag(sync=True)
 
-    def __init__(self, verses: List[Verse], title, **kwargs):
+    def __init__(
+        self, verses: List[Verse], title, highlighted: Set[int] = frozenset(), **kwargs
+    ):
         super().__init__(**kwargs)
-        self.items = [verse.text for verse in verses]
-        self.title = title
+        self.update(verses, title, highlighted)
+
+    def update(
+        self, verses: List[Verse], title, highlighted: Set[int] = frozenset()
+    ) -> None:
+        """Show other verses, the unchanged traitlets being not sent again"""
+        with self.hold_sync():
+            self.items = [
+                {"text": verse.text, "highlight": verse.number in highlighted}
+                for verse in verses
+            ]
+            self.title = title
 
 
 @dataclass
 class BibleApp:
     __search_mode = False
     search_found = False
+    # Search running in the background, if any
+    search_task = None
     # Min, Max length of words for a phrase search
     MIN_QUERY_WORDS: ClassVar[int] = 3
     MAX_QUERY_WORDS: ClassVar[int] = 5
@@ -83,6 +133,14 @@ class BibleApp:
 
         self.search_mode_switcher = v.Switch(v_model=False, label="Search Mode")
         self.search_text = v.TextField(label="Phrase search", v_model="")
+        self.scoring_selected = DEFAULT_SCORING
+        self.scoring_selector = v.Select(
+            v_model=self.scoring_selected,
+            items=list(SCORINGS),
+            label="Scoring",
+            prepend_icon="sort",
+        )
+        self.scoring_selector.on_event("change", self.__on_scoring_changed)
         self.search_submit = v.Btn(color="primary", children=["Submit"])
         self.search_form = v.Html(tag="div", children=[self.search_mode_switcher])
 
@@ -126,7 +184,11 @@ class BibleApp:
         self.book_selected = self.book_selector.v_model
         self.total_chapter: int = self.bible.book(self.book_selected).num_chapter
         self.chapter_selected = 1
-        self.chapter_selector = self.create_chapter_selector(
+        # Toggle's buttons of the chapters, created once and shown as many as needed
+        self.chapter_buttons: List[v.Flex] = []
+        self.chapter_layout = v.Layout(row=True, wrap=True, children=[])
+        self.chapter_selector = v.BtnToggle(v_model=0, children=[self.chapter_layout])
+        self.update_chapter_selector(
             num_chapter=self.total_chapter,
             idx_chapter_selected=self.chapter_selected - 1,
         )
@@ -148,23 +210,58 @@ class BibleApp:
         )
         self.bible_loading = v.ProgressLinear(indeterminate=True)
         self.cloud_loading = v.ProgressLinear(indeterminate=True)
-        chapter_text = (
-            self.bible.book(self.book_selected)
-            .chapter(self.chapter_selected)
-            .clean_text()
+
+        # Widgets of the main content, created once then updated as the state changes
+        self.book_to_similarity_barplot = None
+        self.chapter_to_similarity_marketmap = None
+        self.book_similarity_flex = v.Flex(
+            xs12=True,
+            sm12=True,
+            md5=True,
+            lg5=True,
+            xl5=True,
+            offset_xs1=True,
+            children=[v.Html(tag="h2", children=["Book Similarity Ratio"])],
+        )
+        self.chapter_similarity_title = v.Html(tag="h2", children=[""])
+        self.chapter_similarity_flex = v.Flex(
+            xs12=True,
+            sm12=True,
+            md6=True,
+            lg6=True,
+            xl6=True,
+            children=[self.chapter_similarity_title],
+        )
+        self.cloud_title = v.Html(tag="h2", class_="justify-center", children=[""])
+        # Image of the chapter's cloud, drawn again only for other lemma counts
+        self.chapter_cloud = None
+        self.cloud_frequencies = None
+        self.cloud_flex = v.Flex(
+            xs12=True,
+            sm12=True,
+            md4=True,
+            lg4=True,
+            xl4=True,
+            offset_xs1=True,
+            children=[self.cloud_title],
+        )
+        self.verse_list = VerseList(verses=[], title="")
+        self.search_message = v.Html(tag="h2", children=[""])
+        self.search_message_flex = v.Flex(
+            xs12=True,
+            sm12=True,
+            md12=True,
+            lg12=True,
+            xl12=True,
+            children=[self.search_message],
         )
-        verse_list = self.display_verse_list()
         self.main_content = v.Layout(
             _metadata={"mount_id": "content-main"},
             row=True,
             wrap=True,
-            children=[
-                self.bible_loading,
-                self.draw_chapter_cloud(chapter_text),
-                verse_list,
-                self.search_remove_dialog,
-            ],
+            children=[],
         )
+        self.update_main_content()
 
     @property
     def search_mode(self) -> bool:
@@ -180,89 +277,76 @@ class BibleApp:
     def display_verse_list(self) -> VerseList:
         """
         Display verses' text as a list
-        :return:  VerseList, vuetify template object
+        :return:  VerseList, vuetify template object, updated with the verses
         """
         num_verse = (
             self.bible.book(self.book_selected).chapter(self.chapter_selected).num_verse
         )
-        verse_list = VerseList(
+        highlighted: Set[int] = set()
+        if self.search_mode and self.search_found:
+            # Verses sharing n-grams with the query
+            highlighted = set(
+                self.bible.verse_to_similarity(
+                    self.query,
+                    self.book_selected,
+                    self.chapter_selected,
+                    scoring=self.scoring_selected,
+                )
+            )
+        self.verse_list.update(
             verses=self.bible.book(self.book_selected)
             .chapter(self.chapter_selected)
             .verses,
             title=f"{self.book_selected.title()} {self.chapter_selected}: 1-{num_verse}",
+            highlighted=highlighted,
         )
-        return verse_list
+        return self.verse_list
 
-    def draw_chapter_cloud(self, chapter_text: str) -> v.Flex:
+    def draw_chapter_cloud(self, frequencies: Dict[str, int]) -> v.Flex:
         """
-        Draw frequency of words as clouds
-        :param chapter_text: str, chapter text
-        :return: Flex layout object
+        Draw frequency of words as clouds, unless already drawn for these counts
+        :param frequencies: lemma to count of the chapter
+        :return: Flex layout object, updated with the cloud
         """
+        self.cloud_title.children = [
+            f"{self.book_selected.title()} {self.chapter_selected}"
+        ]
+        if frequencies == self.cloud_frequencies:
+            return self.cloud_flex
         self.bible_loading.active = True
         self.cloud_loading.active = True if self.search_mode else False
-        title_cloud = f"{self.book_selected.title()} {self.chapter_selected}"
-        chapter_cloud = generate_cloud(text=chapter_text)
+        if self.chapter_cloud is None:
+            self.chapter_cloud = generate_cloud(frequencies)
+            self.cloud_flex.children = [self.cloud_title, self.chapter_cloud]
+        else:
+            update_cloud(self.chapter_cloud, frequencies)
+        self.cloud_frequencies = frequencies
         self.bible_loading.active = False
         self.cloud_loading.active = False
-        return v.Flex(
-            xs12=True,
-            sm12=True,
-            md4=True,
-            lg4=True,
-            xl4=True,
-            offset_xs1=True,
-            children=[
-                v.Html(tag="h2", class_="justify-center", children=[title_cloud]),
-                chapter_cloud,
-            ],
-        )
+        return self.cloud_flex
 
     def update_main_content(self) -> None:
         """
-        Change's the main_content of the app's upon application state changes
+        Change's the main_content of the app's upon application state changes,
+        updating the widgets shown rather than creating them again
         :return: None
         """
-        chapter_text = (
+        chapter_cloud = self.draw_chapter_cloud(
             self.bible.book(self.book_selected)
             .chapter(self.chapter_selected)
-            .clean_text()
+            .lemma_counts()
         )
-        chapter_cloud = self.draw_chapter_cloud(chapter_text)
         verse_list = self.display_verse_list()
         if self.search_mode and self.search_found:
+            self.chapter_similarity_title.children = [
+                f"Chapter Similarity Ratio: {self.book_selected.title()}"
+            ]
             self.main_content.children = [
                 self.bible_loading,
                 # Barplot's of book similarity
-                v.Flex(
-                    xs12=True,
-                    sm12=True,
-                    md5=True,
-                    lg5=True,
-                    xl5=True,
-                    offset_xs1=True,
-                    children=[
-                        v.Html(tag="h2", children=[f"Book Similarity Ratio"]),
-                        self.book_to_similarity_barplot,
-                    ],
-                ),
+                self.book_similarity_flex,
                 # Marketplot's of chapter similarity
-                v.Flex(
-                    xs12=True,
-                    sm12=True,
-                    md6=True,
-                    lg6=True,
-                    xl6=True,
-                    children=[
-                        v.Html(
-                            tag="h2",
-                            children=[
-                                f"Chapter Similarity Ratio: {self.book_selected.title()}"
-                            ],
-                        ),
-                        self.chapter_to_similarity_marketmap,
-                    ],
-                ),
+                self.chapter_similarity_flex,
                 self.cloud_loading,
                 chapter_cloud,
                 verse_list,
@@ -276,102 +360,167 @@ class BibleApp:
                 self.search_remove_dialog,
             ]
 
-    def create_chapter_selector(
-        self, num_chapter, idx_chapter_selected: int
+    def update_chapter_selector(
+        self, num_chapter: int, idx_chapter_selected: int
     ) -> v.BtnToggle:
         """
-        Create toggle's button for chapters
+        Show toggle's buttons for chapters, the buttons missing being created
+        and the others being reused from book to book
         :param num_chapter: number of toggle's buttons
         :param idx_chapter_selected: selected index (the first to be toggled)
         :return: toggle button
         """
-
-        chapter_buttons = []
-        for i in range(num_chapter):
+        for i in range(len(self.chapter_buttons), num_chapter):
             button = v.Btn(flat=True, block=True, children=[str(i + 1)])
             button.on_event("click", self.__on_chapter_clicked)
-            chapter_buttons.append(
+            self.chapter_buttons.append(
                 v.Flex(xs2=True, sm2=True, md2=True, lg2=True, children=[button])
             )
-
-        selector = v.BtnToggle(
-            v_model=idx_chapter_selected,
-            children=[v.Layout(row=True, wrap=True, children=chapter_buttons)],
-        )
-
-        return selector
+        self.chapter_layout.children = self.chapter_buttons[:num_chapter]
+        self.chapter_selector.v_model = idx_chapter_selected
+        return self.chapter_selector
 
     def search_phrase(self, *_):
-        """Run the search"""
-        self.search_text.loading = True
-        self.bible_loading.active = True
+        """Run the search in the background, cancelling the one running if any"""
         query_text = self.search_text.v_model
         if count_words(query_text) > BibleApp.MAX_QUERY_WORDS:
             err_msg = f"Max words Limit to {BibleApp.MAX_QUERY_WORDS}"
             self.search_text.error_messages = err_msg
-            self.search_text.loading = False
-            self.bible_loading.active = False
             return
         if count_words(query_text) < BibleApp.MIN_QUERY_WORDS:
             err_msg = f"At least {BibleApp.MIN_QUERY_WORDS} words are required"
             self.search_text.error_messages = err_msg
-            self.search_text.loading = False
-            self.bible_loading.active = False
             return
 
         self.search_mode = True
         self.search_text.error_messages = ""
-        self.book_to_similarity = self.bible.book_to_similarity(query_text)
-        if self.book_to_similarity == {}:
-            self.main_content.children = [
-                v.Flex(
-                    xs12=True,
-                    sm12=True,
-                    md12=True,
-                    lg12=True,
-                    xl12=True,
-                    children=[
-                        v.Html(
-                            tag="h2",
-                            children=[
-                                f"Search phrase not found: '{self.search_text.v_model}'"
-                            ],
-                        )
-                    ],
+        if self.search_task is not None:
+            self.search_task.cancel()
+        self.search_task = asyncio.ensure_future(self.run_search(query_text))
+
+    async def run_search(self, query_text: str) -> None:
+        """
+        Search a query off the kernel's event loop: books are scored a few at a time
+        in SEARCH_EXECUTOR and the bar plot shows the books scored so far.
+        Cancelled between two steps, e.g when another query is submitted.
+        :param query_text: query text
+        :return: None
+        """
+        loop = asyncio.get_event_loop()
+        bible, scoring = self.bible, self.scoring_selected
+        self.search_text.loading = True
+        self.bible_loading.active = True
+        self.bible_loading.indeterminate = False
+        self.bible_loading.value = 0
+        try:
+            # Normalized once, then passed down to every book's scoring
+            query = await loop.run_in_executor(
+                SEARCH_EXECUTOR, bible.prepare_query, query_text
+            )
+            steps = bible.iter_book_to_similarity(query, scoring=scoring)
+            book_to_similarity: Dict[BookName, SimRatio] = {}
+            barplot = None
+            while True:
+                step = await loop.run_in_executor(SEARCH_EXECUTOR, next, steps, None)
+                if step is None:
+                    break
+                progress, book_to_similarity = step
+                self.bible_loading.value = 100 * progress
+                if not book_to_similarity:
+                    continue
+                if barplot is None:
+                    barplot = self.show_partial_search(book_to_similarity)
+                else:
+                    update_barplot(barplot, book_to_similarity)
+
+            self.query = query
+            self.book_to_similarity = book_to_similarity
+            if book_to_similarity == {}:
+                self.show_search_not_found(query_text)
+                return
+
+            self.book_selector.items = list(book_to_similarity.keys())
+            self.book_selected: str = list(book_to_similarity.keys())[0]
+            self.book_selector.v_model = self.book_selected
+            # Scored off the event loop, then read from the search cache
+            await loop.run_in_executor(
+                SEARCH_EXECUTOR,
+                partial(
+                    bible.book(self.book_selected).chapter_to_similarity,
+                    query,
+                    scoring=scoring,
                 ),
-                self.search_remove_dialog,
-            ]
-            self.search_found = False
-            self.search_text.loading = False
-            self.bible_loading.active = False
-            return
+            )
+            self.search_found = True
+            # Trigger updates from book -> chapter -> verses to be displayed
+            self.__on_book_selected()
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            # Shown, instead of lost in the background task
+            self.search_text.error_messages = f"Search failed: {error}"
+        finally:
+            # Unless another search runs already
+            if self.search_task is asyncio.current_task():
+                self.search_text.loading = False
+                self.bible_loading.indeterminate = True
+                self.bible_loading.active = False
 
-        self.search_found = True
-        self.book_to_similarity_barplot = self.create_book_to_similarity_barplot(
-            self.book_to_similarity
-        )
-        self.book_selector.items = list(self.book_to_similarity.keys())
-        self.book_selected: str = list(self.book_to_similarity.keys())[0]
-        self.book_selector.v_model = self.book_selected
-        chapter_to_similarity = self.bible.book(
-            self.book_selected
-        ).chapter_to_similarity(query_text)
-
-        self.chapter_to_similarity_marketmap = self.create_chapter_market_map(
-            chapter_to_similarity
-        )
-        self.similarity_plots = v.Layout(
-            row=True,
-            wrap=True,
-            children=[
+    def show_partial_search(
+        self, book_to_similarity: Dict[BookName, SimRatio]
+    ) -> bq.Figure:
+        """
+        Show the book similarity of the books scored so far, alone
+        :param book_to_similarity: book to similarity, so far
+        :return: the bar plot, to be updated by the next steps
+        """
+        self.search_found = False
+        if self.book_to_similarity_barplot is None:
+            self.book_to_similarity_barplot = self.create_book_to_similarity_barplot(
+                book_to_similarity
+            )
+            self.book_similarity_flex.children = [
+                *self.book_similarity_flex.children,
                 self.book_to_similarity_barplot,
+            ]
+        else:
+            update_barplot(self.book_to_similarity_barplot, book_to_similarity)
+        self.main_content.children = [
+            self.bible_loading,
+            self.book_similarity_flex,
+            self.search_remove_dialog,
+        ]
+        return self.book_to_similarity_barplot
+
+    def show_search_not_found(self, query_text: str) -> None:
+        self.search_message.children = [f"Search phrase not found: '{query_text}'"]
+        self.main_content.children = [
+            self.search_message_flex,
+            self.search_remove_dialog,
+        ]
+        self.search_found = False
+
+    def show_chapter_market_map(self, chapter_to_similarity: Dict[int, float]) -> None:
+        """
+        Show the chapter similarity of the selected book in the market map,
+        created by the first search found
+        :param chapter_to_similarity: chapter to similarity of the selected book
+        :return: None
+        """
+        if self.chapter_to_similarity_marketmap is None:
+            self.chapter_to_similarity_marketmap = self.create_chapter_market_map(
+                chapter_to_similarity
+            )
+            self.chapter_similarity_flex.children = [
+                self.chapter_similarity_title,
                 self.chapter_to_similarity_marketmap,
-            ],
-        )
-        # Trigger updates from book -> chapter -> verses to be displayed
-        self.__on_book_selected()
-        self.search_text.loading = False
-        self.bible_loading.active = False
+            ]
+        else:
+            update_market_map(
+                self.chapter_to_similarity_marketmap,
+                chapter_to_similarity,
+                self.chapter_selected,
+            )
 
     def create_book_to_similarity_barplot(
         self, book_to_similarity: Dict[BookName, SimRatio]
@@ -425,9 +574,7 @@ class BibleApp:
 
         col = bq.ColorScale()
         ax_c = bq.ColorAxis(scale=col, label="ratio", visible=True, num_ticks=3)
-        data = pd.DataFrame.from_dict(
-            chapter_to_similarity, orient="index", columns=["sim"]
-        )
+        data = similarity_frame(chapter_to_similarity)
 
         market_map = MarketMap(
             names=list(chapter_to_similarity.keys()),
@@ -454,7 +601,11 @@ class BibleApp:
 
         def selected_index_changed(change):
             try:
-                self.chapter_selected = change["new"][-1]
+                chapter_selected = change["new"][-1]
+                # Selected by the app, e.g a chapter's button clicked
+                if chapter_selected == self.chapter_selected:
+                    return
+                self.chapter_selected = chapter_selected
                 market_map.selected = [self.chapter_selected]
                 # Note: v_model from chapter selector is an index starting from 0
                 self.chapter_selector.v_model = self.chapter_selected - 1
@@ -472,6 +623,7 @@ class BibleApp:
             self.search_form.children = [
                 self.search_mode_switcher,
                 self.search_text,
+                self.scoring_selector,
                 self.search_submit,
             ]
         else:
@@ -481,6 +633,12 @@ class BibleApp:
             else:
                 self.search_remove_dialog.v_model = True
 
+    def __on_scoring_changed(self, *_) -> None:
+        """Callback as scoring changed, a shown search is run again"""
+        self.scoring_selected = self.scoring_selector.v_model
+        if self.search_mode and self.search_found:
+            self.search_phrase()
+
     def __on_language_changed(self, *_) -> None:
         """Callback as language changed"""
         self.language_selector.loading = True
@@ -532,13 +690,11 @@ class BibleApp:
         if self.search_mode and self.search_found:
             chapter_to_similarity = self.bible.book(
                 self.book_selected
-            ).chapter_to_similarity(self.search_text.v_model)
+            ).chapter_to_similarity(self.query, scoring=self.scoring_selected)
             # Default to the first chapter,
             # given that chapter_to_similarity is sorted from highest to lowest score
             self.chapter_selected = list(chapter_to_similarity.keys())[0]
-            self.chapter_to_similarity_marketmap = self.create_chapter_market_map(
-                chapter_to_similarity
-            )
+            self.show_chapter_market_map(chapter_to_similarity)
             # Update the barplot mark's selected attributes to the selected book
             books = list(self.book_to_similarity.keys())
             selected_book_idx = books.index(self.book_selected)
@@ -553,17 +709,10 @@ class BibleApp:
                 else 1
             )
 
-        self.chapter_selector = self.create_chapter_selector(
+        self.update_chapter_selector(
             num_chapter=self.total_chapter,
             idx_chapter_selected=self.chapter_selected - 1,
         )
-        self.bible_nav_selector.children = [
-            self.search_form,
-            self.language_selector,
-            self.version_selector,
-            self.book_selector,
-            self.chapter_selector,
-        ]
         self.update_main_content()
         self.book_selector.loading = False
 
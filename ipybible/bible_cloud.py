@@ -1,46 +1,164 @@
+import io
+import os
 import ipywidgets as widgets  # type: ignore
 import numpy as np  # type: ignore
-import matplotlib.pyplot as plt  # type: ignore
 import hashlib  # type: ignore
 
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
 from pathlib import Path
+from typing import Dict, Iterable, Tuple
 from PIL import Image  # type: ignore
 from wordcloud import ImageColorGenerator, WordCloud  # type: ignore
-from diskcache import Index  # type: ignore
 
 from ipybible import IMG_DATA_DIR
+from ipybible.store import CLOUD, LRUIndex
 
+# Word to count
+Frequencies = Dict[str, int]
 LOVE_MASK_IMG = IMG_DATA_DIR / "love.png"
-CLOUD_INDEX = Index()
-
-
-def hash_txt(text: str) -> str:
-    hash_object = hashlib.sha256(text.encode("utf-8"))
-    hex_dig = hash_object.hexdigest()
-    return hex_dig
-
-
-def generate_cloud(text: str, mask_img: Path = LOVE_MASK_IMG):
-    hashed_text = hash_txt(text)
-    out = widgets.Output()
-    mask = np.array(Image.open(mask_img))
-    with out:
-        if hashed_text in CLOUD_INDEX:
-            wordcloud_bible = CLOUD_INDEX[hashed_text]
-        else:
-            wordcloud_bible = WordCloud(
-                # stopwords=set(STOPWORDS),
-                background_color=None,
-                mode="RGBA",
-                max_words=1000,
-                mask=mask,
-            ).generate(text)
-            CLOUD_INDEX[hashed_text] = wordcloud_bible
-        image_colors = ImageColorGenerator(mask)
-        plt.figure(figsize=[15, 15])
-        plt.imshow(
-            wordcloud_bible.recolor(color_func=image_colors), interpolation="bilinear"
+# Maximum width, in pixels, and format of the clouds' images, e.g webp
+CLOUD_WIDTH = 500
+CLOUD_FORMAT = "png"
+# Persistent, to be warmed ahead of time, e.g by `ipybible pregenerate-clouds`,
+# the most recently used ones are kept in memory
+CLOUD_INDEX = LRUIndex(
+    CLOUD.open(), maxsize=int(os.environ.get("IPYBIBLE_CLOUD_CACHE_SIZE", 100))
+)
+
+
+@lru_cache(maxsize=None)
+def load_mask(mask_img: Path) -> np.ndarray:
+    """Mask's image, decoded once per process"""
+    return np.array(Image.open(mask_img))
+
+
+@lru_cache(maxsize=None)
+def color_generator(mask_img: Path) -> ImageColorGenerator:
+    """Colors of the clouds masked by a mask's image, computed once per process"""
+    return ImageColorGenerator(load_mask(mask_img))
+
+
+def new_word_cloud(mask_img: Path = LOVE_MASK_IMG) -> WordCloud:
+    return WordCloud(
+        # stopwords=set(STOPWORDS),
+        background_color=None,
+        mode="RGBA",
+        max_words=1000,
+        mask=load_mask(mask_img),
+    )
+
+
+def hash_frequencies(frequencies: Frequencies) -> str:
+    text = " ".join(f"{word}:{count}" for word, count in sorted(frequencies.items()))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def cloud_image_key(
+    frequencies: Frequencies, mask_img: Path, width: int, image_format: str
+) -> Tuple[str, str, str, int, str]:
+    return ("image", hash_frequencies(frequencies), mask_img.stem, width, image_format)
+
+
+def cloud_image(
+    frequencies: Frequencies,
+    mask_img: Path = LOVE_MASK_IMG,
+    width: int = CLOUD_WIDTH,
+    image_format: str = CLOUD_FORMAT,
+) -> bytes:
+    """
+    Image of a word cloud colored as its mask, rendered once and kept in
+    CLOUD_INDEX. The cloud itself, holding its mask, is not stored.
+    :param frequencies: word to count, e.g lemmas counted with the corpus
+    :param mask_img: image masking the cloud's shape
+    :param width: maximum width of the image, in pixels
+    :param image_format: format of the image, e.g png or webp
+    :return: the image's bytes
+    """
+    key = cloud_image_key(frequencies, mask_img, width, image_format)
+    image = CLOUD_INDEX.get(key)
+    if image is None:
+        # Words counted already, the text is not tokenized again
+        wordcloud_bible = new_word_cloud(mask_img=mask_img).generate_from_frequencies(
+            frequencies
         )
-        plt.axis("off")
-        plt.show()
-        return out
+        picture = wordcloud_bible.recolor(
+            color_func=color_generator(mask_img)
+        ).to_image()
+        # Scaled down to the width only, keeping the mask's ratio
+        picture.thumbnail((width, picture.height))
+        buffer = io.BytesIO()
+        picture.save(buffer, format=image_format)
+        image = buffer.getvalue()
+        CLOUD_INDEX[key] = image
+    return image
+
+
+def store_cloud_image(
+    frequencies: Frequencies, mask_img: Path, width: int, image_format: str
+) -> None:
+    """Render a cloud's image, kept in CLOUD_INDEX rather than sent back"""
+    cloud_image(frequencies, mask_img=mask_img, width=width, image_format=image_format)
+
+
+def pregenerate_clouds(
+    frequency_tables: Iterable[Frequencies],
+    workers: int = 1,
+    mask_img: Path = LOVE_MASK_IMG,
+    width: int = CLOUD_WIDTH,
+    image_format: str = CLOUD_FORMAT,
+) -> int:
+    """
+    Render the clouds' images ahead of time, e.g of every chapter of a version,
+    the images already stored being skipped
+    :param frequency_tables: word to count of every cloud
+    :param workers: number of processes rendering the images
+    :param mask_img: image masking the clouds' shape
+    :param width: maximum width of the images, in pixels
+    :param image_format: format of the images, e.g png or webp
+    :return: number of images rendered
+    """
+    key_to_frequencies = {
+        cloud_image_key(frequencies, mask_img, width, image_format): frequencies
+        for frequencies in frequency_tables
+    }
+    missing = [
+        frequencies
+        for key, frequencies in key_to_frequencies.items()
+        if key not in CLOUD_INDEX
+    ]
+    render = partial(
+        store_cloud_image, mask_img=mask_img, width=width, image_format=image_format
+    )
+    if workers == 1:
+        for frequencies in missing:
+            render(frequencies)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Only the frequencies are sent, a few at a time
+            for _ in executor.map(render, missing, chunksize=4):
+                pass
+    return len(missing)
+
+
+def generate_cloud(
+    frequencies: Frequencies, mask_img: Path = LOVE_MASK_IMG
+) -> widgets.Image:
+    """
+    Word cloud as an image widget
+    :param frequencies: word to count, e.g a chapter's `lemma_counts()`
+    :param mask_img: image masking the cloud's shape
+    :return: Image widget
+    """
+    return widgets.Image(
+        value=cloud_image(frequencies, mask_img=mask_img),
+        format=CLOUD_FORMAT,
+        layout=widgets.Layout(max_width="100%", height="auto"),
+    )
+
+
+def update_cloud(
+    cloud: widgets.Image, frequencies: Frequencies, mask_img: Path = LOVE_MASK_IMG
+) -> None:
+    """Show another word cloud in an image widget, sending its image only"""
+    cloud.value = cloud_image(frequencies, mask_img=mask_img)
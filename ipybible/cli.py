@@ -1,10 +1,92 @@
 import click
 import json
+import os
 
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict
 from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
 
-from ipybible.extraction import IBook
+from ipybible.download import BASE_URL, BookDownloader
 from ipybible.books import BOOKS
+from ipybible.scorings import DEFAULT_SCORING, SCORINGS
+
+# The bible modules (spacy models, widgets) are imported by the commands needing them
+
+
+def parse_version(version: str, language: str) -> Tuple[str, str]:
+    """
+    Version and its language, given as kjv or kjv:EN
+    :param version: bible's version, with an optional language
+    :param language: default language
+    :return: version, language
+    """
+    name, _, version_language = version.partition(":")
+    return name, (version_language or language).upper()
+
+
+def read_queries(query: Optional[str], queries_file) -> List[str]:
+    """Query of the argument and/or queries of a file, one per line"""
+    queries = [query] if query else []
+    if queries_file is not None:
+        queries.extend(line.strip() for line in queries_file if line.strip())
+    if not queries:
+        raise click.UsageError("A query or a file of queries is required")
+    return queries
+
+
+def preload_version(version: str, language: str, n_process: int) -> Tuple[str, int]:
+    """
+    Download, clean and index a bible's version, unless already done
+    :param version: bible's version, e.g kjv
+    :param language: language of the version, e.g EN
+    :param n_process: number of spacy processes to clean the text
+    :return: version, number of books
+    """
+    from ipybible.bible import Bible
+
+    Bible.CLEAN_N_PROCESS = n_process
+    bible = Bible(version=version, language=language)
+    bible.ngram_index
+    return version, len(bible.books)
+
+
+scoring_option = click.option(
+    "--scoring",
+    help="scoring of the similarity",
+    type=click.Choice(SCORINGS),
+    default=DEFAULT_SCORING,
+    show_default=True,
+)
+
+
+def search_query(
+    bible,
+    query,
+    books: Iterable[str] = (),
+    top_books: int = 1,
+    scoring: str = DEFAULT_SCORING,
+) -> Dict:
+    """
+    Book and chapter similarity of a query, as shown by the app
+    :param bible: Bible
+    :param query: prepared query
+    :param books: books to rank the chapters of
+    :param top_books: else, number of most similar books to rank the chapters of
+    :param scoring: name of the scoring, e.g bm25
+    :return: query, book to similarity and book to its chapter to similarity
+    """
+    book_to_similarity = bible.book_to_similarity(query, scoring=scoring)
+    books = list(books) or list(book_to_similarity)[:top_books]
+    return {
+        "query": query.text,
+        "scoring": scoring,
+        "book_to_similarity": book_to_similarity,
+        "chapter_to_similarity": {
+            book: bible.book(book).chapter_to_similarity(query, scoring=scoring)
+            for book in books
+        },
+    }
 
 
 @click.group()
@@ -16,13 +98,316 @@ def main():
 @click.option(
     "--out", help="output directory path", type=Path, default=Path.cwd, required=False
 )
-def get_bible(out):
+@click.option("--version", help="bible's version", default="basicenglish")
+def get_bible(out, version):
     """
-    Get Bible in json format
-    :param out:
+    Get Bible in json format, one file per book
+    :param out: output directory
+    :param version: bible's version, e.g kjv
     :return:
     """
-    for book in BOOKS:
-        book_chapters = IBook(book).chapter_to_text(version="basicenglish")
+    book_to_chapters = {}
+    BookDownloader(base_url=BASE_URL).download(BOOKS, book_to_chapters, version=version)
+    for book, book_chapters in book_to_chapters.items():
         with open(Path(out) / f"{book}.json", "w") as out_json:
             json.dump(book_chapters, out_json)
+
+
+@main.command()
+@click.argument("path", type=click.Path(exists=True))
+@click.option("--version", help="bible's version", required=True)
+@click.option("--language", help="language of the version, e.g EN", required=True)
+def import_bible(path, version, language):
+    """
+    Import a bible's version from json files, e.g written by get-bible
+    :param path: directory or zip/tar archive of <book>.json files
+    :param version: bible's version, e.g kjv
+    :param language: language of the version, e.g EN
+    :return:
+    """
+    from ipybible.bible import Bible
+
+    bible = Bible.from_files(version=version, language=language, path=path)
+    click.echo(f"Imported {len(bible.books)} books of {version}")
+
+
+@main.command()
+@click.argument("versions", nargs=-1, required=True)
+@click.option("--language", help="language of the versions, e.g EN", default="EN")
+@click.option("--workers", help="number of versions preloaded at once", type=int)
+@click.option(
+    "--n-process",
+    help="number of spacy processes per version, more than 1 needs spacy>=2.2",
+    type=int,
+    default=1,
+)
+def preload(versions, language, workers, n_process):
+    """
+    Download, clean and index bible's versions in parallel, e.g kjv statenvertaling:NL
+    :param versions: bible's versions, optionally with their language
+    :param language: default language of the versions
+    :param workers: number of versions preloaded at once, default to all of them
+    :param n_process: number of spacy processes cleaning the text of a version
+    :return:
+    """
+    version_languages = [parse_version(version, language) for version in versions]
+    workers = workers or len(version_languages)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(preload_version, version, version_language, n_process)
+            for version, version_language in version_languages
+        ]
+        for future in as_completed(futures):
+            version, num_books = future.result()
+            click.echo(f"Preloaded {num_books} books of {version}")
+
+
+@main.command()
+@click.argument("query", required=False)
+@click.option("--queries", help="file of queries, one per line", type=click.File())
+@click.option("--version", help="bible's version", default="kjv")
+@click.option("--language", help="language of the version, e.g EN", default="EN")
+@click.option(
+    "--book",
+    "books",
+    help="book to rank the chapters of, default to the most similar book",
+    multiple=True,
+)
+@click.option("--workers", help="number of search processes", type=int, default=1)
+@scoring_option
+@click.option("--out", help="output JSON file", type=click.File("w"), default="-")
+def search(query, queries, version, language, books, workers, scoring, out):
+    """
+    Search a query, or a file of queries, and write the similarities as JSON
+    :param query: query text
+    :param queries: file of queries, one per line
+    :param version: bible's version, e.g kjv
+    :param language: language of the version, e.g EN
+    :param books: books to rank the chapters of
+    :param workers: number of search processes, for many queries
+    :param scoring: name of the scoring, e.g bm25
+    :param out: output JSON file, default to stdout
+    :return:
+    """
+    from ipybible.bible import Bible
+
+    texts = read_queries(query, queries)
+    with Bible(version=version, language=language) as bible:
+        if len(texts) > 1:
+            # Fill the search cache at once, from the worker processes if any
+            bible.book_to_similarity_many(texts, workers=workers, scoring=scoring)
+        results = [
+            search_query(bible, bible.prepare_query(text), books=books, scoring=scoring)
+            for text in texts
+        ]
+    json.dump(results, out, indent=2)
+    out.write("\n")
+
+
+@main.command()
+@click.argument("query")
+@click.argument("versions", nargs=-1, required=True)
+@click.option("--language", help="language of the versions, e.g EN", default="EN")
+@click.option("-k", help="number of hits per version", type=int, default=10)
+@click.option(
+    "--level",
+    help="level of the hits",
+    type=click.Choice(["book", "chapter", "verse"]),
+    default="book",
+)
+@scoring_option
+@click.option(
+    "--workers",
+    help="number of search processes, default to the number of CPUs",
+    type=int,
+)
+@click.option("--out", help="output JSON file", type=click.File("w"), default="-")
+def compare(query, versions, language, k, level, scoring, workers, out):
+    """
+    Search a query in several bible's versions at once, e.g kjv basicenglish,
+    and write the hits of every version and of all of them as JSON
+    :param query: query text
+    :param versions: bible's versions, optionally with their language
+    :param language: default language of the versions
+    :param k: number of hits per version
+    :param level: book, chapter or verse
+    :param scoring: name of the scoring, e.g bm25
+    :param workers: number of search processes shared by the versions
+    :param out: output JSON file, default to stdout
+    :return:
+    """
+    from ipybible.bible import (
+        Bible,
+        merge_hits,
+        search_versions,
+        shutdown_shared_executor,
+    )
+
+    bibles = [
+        Bible(version=version, language=version_language)
+        for version, version_language in (
+            parse_version(version, language) for version in versions
+        )
+    ]
+    try:
+        version_to_hits = search_versions(
+            query, bibles, k=k, level=level, scoring=scoring, workers=workers
+        )
+    finally:
+        shutdown_shared_executor()
+    result = {
+        "query": query,
+        "scoring": scoring,
+        "version_to_hits": {
+            version: [asdict(hit) for hit in hits]
+            for version, hits in version_to_hits.items()
+        },
+        "hits": [asdict(hit) for hit in merge_hits(version_to_hits)],
+    }
+    json.dump(result, out, indent=2)
+    out.write("\n")
+
+
+@main.command()
+@click.argument("queries", type=click.File())
+@click.option("--version", help="bible's version", default="kjv")
+@click.option("--language", help="language of the version, e.g EN", default="EN")
+@click.option(
+    "--top-books", help="number of most similar books to warm", type=int, default=1
+)
+@click.option("--workers", help="number of search processes", type=int, default=1)
+@scoring_option
+def warm_cache(queries, version, language, top_books, workers, scoring):
+    """
+    Fill the search and cloud caches for a file of queries, one per line,
+    before the app's users search them
+    :param queries: file of queries
+    :param version: bible's version, e.g kjv
+    :param language: language of the version, e.g EN
+    :param top_books: number of most similar books to warm, per query
+    :param workers: number of search processes
+    :param scoring: name of the scoring, e.g bm25
+    :return:
+    """
+    from ipybible.bible import Bible
+    from ipybible.bible_cloud import cloud_image
+
+    texts = read_queries(None, queries)
+    with Bible(version=version, language=language) as bible:
+        if len(texts) > 1:
+            bible.book_to_similarity_many(texts, workers=workers, scoring=scoring)
+        # The chapter shown before any search
+        first_book = bible.books[0]
+        chapters = {(first_book.name, first_book.chapter_numbers[0])}
+        for text in texts:
+            result = search_query(
+                bible, bible.prepare_query(text), top_books=top_books, scoring=scoring
+            )
+            # The app shows the most similar chapter of a selected book
+            for book, chapter_to_similarity in result["chapter_to_similarity"].items():
+                chapters.add((book, next(iter(chapter_to_similarity))))
+        for book, chapter_number in chapters:
+            cloud_image(bible.book(book).chapter(chapter_number).lemma_counts())
+    click.echo(f"Warmed {len(texts)} queries and {len(chapters)} clouds")
+
+
+@main.command()
+@click.argument("versions", nargs=-1, required=True)
+@click.option("--language", help="language of the versions, e.g EN", default="EN")
+@click.option("--workers", help="number of rendering processes", type=int)
+def pregenerate_clouds(versions, language, workers):
+    """
+    Render the word clouds of every chapter of bible's versions ahead of time,
+    across processes, e.g kjv statenvertaling:NL
+    :param versions: bible's versions, optionally with their language
+    :param language: default language of the versions
+    :param workers: number of rendering processes, default to the number of CPUs
+    :return:
+    """
+    from ipybible.bible import Bible
+    from ipybible.bible_cloud import pregenerate_clouds as pregenerate
+
+    for version, version_language in (
+        parse_version(version, language) for version in versions
+    ):
+        with Bible(version=version, language=version_language) as bible:
+            # Counted along with the corpus, the text is not tokenized again
+            chapter_frequencies = [
+                chapter.lemma_counts()
+                for book in bible.books
+                for chapter in book.chapters
+            ]
+        rendered = pregenerate(
+            chapter_frequencies, workers=workers or os.cpu_count() or 1
+        )
+        click.echo(
+            f"Rendered {rendered} of {len(chapter_frequencies)} clouds of {version}"
+        )
+
+
+def parse_chapters(chapters: str) -> range:
+    """Chapter numbers of a range, given as 3 or 1-5"""
+    first, _, last = chapters.partition("-")
+    try:
+        return range(int(first), int(last or first) + 1)
+    except ValueError:
+        raise click.BadParameter(
+            f"{chapters} is not a chapter or a range, e.g 1-5", param_hint="--chapters"
+        )
+
+
+@main.command()
+@click.argument("book")
+@click.option("--version", help="bible's version", default="kjv")
+@click.option("--language", help="language of the version, e.g EN", default="EN")
+@click.option("--chapters", help="chapters, e.g 1-5, default to the whole book")
+@click.option("-k", help="number of terms", type=int, default=10)
+def top_terms(book, version, language, chapters, k):
+    """
+    Show the most frequent lemmas of a book, or of some of its chapters
+    :param book: book's name, e.g genesis
+    :param version: bible's version, e.g kjv
+    :param language: language of the version, e.g EN
+    :param chapters: chapters, e.g 1-5
+    :param k: number of terms
+    :return:
+    """
+    from ipybible.bible import Bible
+
+    chapter_numbers = parse_chapters(chapters) if chapters else None
+    with Bible(version=version, language=language) as bible:
+        if book not in [bible_book.name for bible_book in bible.books]:
+            raise click.BadParameter(f"{book} not in {version}", param_hint="BOOK")
+        terms = bible.book(book).top_terms(k, chapter_numbers=chapter_numbers)
+    for term, count in terms:
+        click.echo(f"{term}\t{count}")
+
+
+@main.command()
+def cache_stats():
+    """
+    Show the entries, volume and hit ratio of every store's namespace
+    :return:
+    """
+    from ipybible.store import store_stats
+
+    for name, stats in store_stats().items():
+        lookups = stats["hits"] + stats["misses"]
+        hit_ratio = f"{stats['hits'] / lookups:.0%}" if lookups else "-"
+        click.echo(
+            f"{name}: {stats['count']} entries, "
+            f"{stats['volume'] / 2 ** 20:.1f}/{stats['size_limit'] / 2 ** 20:.0f} MB, "
+            f"{stats['eviction_policy']}, hit ratio {hit_ratio}"
+        )
+
+
+@main.command()
+def cache_prune():
+    """
+    Remove expired entries and evict entries above the size limits of the stores
+    :return:
+    """
+    from ipybible.store import prune_stores
+
+    for name, removed in prune_stores().items():
+        click.echo(f"{name}: {removed} entries removed")
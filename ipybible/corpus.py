@@ -0,0 +1,417 @@
+"""Compact, columnar text of a bible's version"""
+import json
+import mmap
+import os
+import struct
+
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import ClassVar, Dict, Iterable, List, Optional, Tuple, Union
+
+BookName = str
+ChapterNum = int
+VerseNum = int
+# Bytes, array, memory-mapped memoryview or numpy array
+Buffer = Union[bytes, array, memoryview]
+
+# Separator between verses of a chapter and chapters of a book
+SEPARATOR = b" "
+# Separator between books
+BOOK_SEPARATOR = b"\n"
+
+MAGIC = b"IPYBIBLE"
+# Bumped whenever the sections change, a file of another format is rejected
+FILE_FORMAT = 1
+# Sections start at a multiple of ALIGNMENT bytes, for the memory-mapped arrays
+ALIGNMENT = 8
+
+
+class CorpusFormatError(ValueError):
+    """Corpus file written in another format than FILE_FORMAT"""
+
+
+@dataclass
+class Corpus:
+    """
+    All the text of a bible's version in one UTF-8 buffer.
+    Books, chapters and verses are rows of offset arrays:
+    - book_chapters[b]:book_chapters[b + 1] are the chapter rows of book b
+    - chapter_verses[c]:chapter_verses[c + 1] are the verse rows of chapter c
+    - *_spans[2 * row], *_spans[2 * row + 1] are the byte offsets of a row's text
+    A chapter's text is its verses joined by a space, a book's text its chapters.
+    The clean text, if any, has the same layout in its own buffer.
+    Lemmas of the clean text are counted per chapter and per book:
+    - lemma_offsets[i]:lemma_offsets[i + 1] are the bytes of lemma i in lemma_buffer
+    - chapter_lemma_rows[c]:chapter_lemma_rows[c + 1] are the rows of chapter c in
+      chapter_lemma_ids and chapter_lemma_freqs, the most frequent lemma first
+    """
+
+    language: str
+    buffer: Buffer
+    book_names: List[BookName]
+    book_chapters: Buffer
+    book_spans: Buffer
+    chapter_numbers: Buffer
+    chapter_verses: Buffer
+    chapter_spans: Buffer
+    verse_numbers: Buffer
+    verse_spans: Buffer
+    clean_buffer: Optional[Buffer] = None
+    clean_book_spans: Optional[Buffer] = None
+    clean_chapter_spans: Optional[Buffer] = None
+    clean_verse_spans: Optional[Buffer] = None
+    lemma_buffer: Optional[Buffer] = None
+    lemma_offsets: Optional[Buffer] = None
+    chapter_lemma_rows: Optional[Buffer] = None
+    chapter_lemma_ids: Optional[Buffer] = None
+    chapter_lemma_freqs: Optional[Buffer] = None
+    book_lemma_rows: Optional[Buffer] = None
+    book_lemma_ids: Optional[Buffer] = None
+    book_lemma_freqs: Optional[Buffer] = None
+    SECTIONS: ClassVar[List[str]] = [
+        "buffer",
+        "book_chapters",
+        "book_spans",
+        "chapter_numbers",
+        "chapter_verses",
+        "chapter_spans",
+        "verse_numbers",
+        "verse_spans",
+        "clean_buffer",
+        "clean_book_spans",
+        "clean_chapter_spans",
+        "clean_verse_spans",
+        "lemma_buffer",
+        "lemma_offsets",
+        "chapter_lemma_rows",
+        "chapter_lemma_ids",
+        "chapter_lemma_freqs",
+        "book_lemma_rows",
+        "book_lemma_ids",
+        "book_lemma_freqs",
+    ]
+
+    @classmethod
+    def build(
+        cls, language: str, rows: Iterable[Tuple[BookName, ChapterNum, VerseNum, str]]
+    ) -> "Corpus":
+        """
+        Build a corpus from verses
+        :param language: language of the text, e.g EN
+        :param rows: (book name, chapter number, verse number, text) of every verse,
+                     grouped by book and chapter
+        :return: Corpus
+        """
+        buffer = bytearray()
+        book_names: List[BookName] = []
+        book_chapters, book_spans = array("q", [0]), array("q")
+        chapter_numbers, chapter_verses = array("q"), array("q", [0])
+        chapter_spans = array("q")
+        verse_numbers, verse_spans = array("q"), array("q")
+
+        def close_chapter():
+            chapter_verses.append(len(verse_numbers))
+            chapter_spans.extend((chapter_start, len(buffer)))
+
+        def close_book():
+            close_chapter()
+            book_chapters.append(len(chapter_numbers))
+            book_spans.extend((book_start, len(buffer)))
+
+        current: Tuple[Optional[BookName], Optional[ChapterNum]] = (None, None)
+        book_start = chapter_start = 0
+        for book_name, chapter_num, verse_num, text in rows:
+            if book_name != current[0]:
+                if book_names:
+                    close_book()
+                    buffer.extend(BOOK_SEPARATOR)
+                book_names.append(book_name)
+                book_start = chapter_start = len(buffer)
+                chapter_numbers.append(chapter_num)
+            elif chapter_num != current[1]:
+                close_chapter()
+                buffer.extend(SEPARATOR)
+                chapter_start = len(buffer)
+                chapter_numbers.append(chapter_num)
+            else:
+                buffer.extend(SEPARATOR)
+            current = (book_name, chapter_num)
+            verse_start = len(buffer)
+            buffer.extend(text.strip().encode("utf-8"))
+            verse_numbers.append(verse_num)
+            verse_spans.extend((verse_start, len(buffer)))
+        if book_names:
+            close_book()
+
+        return cls(
+            language=language,
+            buffer=bytes(buffer),
+            book_names=book_names,
+            book_chapters=book_chapters,
+            book_spans=book_spans,
+            chapter_numbers=chapter_numbers,
+            chapter_verses=chapter_verses,
+            chapter_spans=chapter_spans,
+            verse_numbers=verse_numbers,
+            verse_spans=verse_spans,
+        )
+
+    def add_clean_text(self, clean_verse_texts: Iterable[str]) -> None:
+        """
+        Add the clean text of every verse, chapters and books join their clean verses
+        :param clean_verse_texts: clean text of every verse, in the corpus order
+        :return: None
+        """
+        clean_buffer = bytearray()
+        clean_book_spans, clean_chapter_spans = array("q"), array("q")
+        clean_verse_spans = array("q")
+        clean_verse_texts = iter(clean_verse_texts)
+        for book_row in range(len(self.book_names)):
+            book_start = len(clean_buffer)
+            for chapter_row in self.chapter_rows(book_row):
+                if len(clean_buffer) > book_start:
+                    clean_buffer.extend(SEPARATOR)
+                chapter_start = len(clean_buffer)
+                for _ in self.verse_rows(chapter_row):
+                    clean_text = next(clean_verse_texts).encode("utf-8")
+                    # Empty clean verses are skipped when joining, no separator
+                    if clean_text and len(clean_buffer) > chapter_start:
+                        clean_buffer.extend(SEPARATOR)
+                    verse_start = len(clean_buffer)
+                    clean_buffer.extend(clean_text)
+                    clean_verse_spans.extend((verse_start, len(clean_buffer)))
+                if len(clean_buffer) == chapter_start and chapter_start > book_start:
+                    # Nothing was added, drop the separator again
+                    del clean_buffer[-len(SEPARATOR) :]
+                    chapter_start = len(clean_buffer)
+                clean_chapter_spans.extend((chapter_start, len(clean_buffer)))
+            clean_book_spans.extend((book_start, len(clean_buffer)))
+            clean_buffer.extend(BOOK_SEPARATOR)
+        self.clean_buffer = bytes(clean_buffer)
+        self.clean_book_spans = clean_book_spans
+        self.clean_chapter_spans = clean_chapter_spans
+        self.clean_verse_spans = clean_verse_spans
+        self.add_lemma_counts()
+
+    def add_lemma_counts(self) -> None:
+        """
+        Count the lemmas of the clean text of every chapter and book,
+        the words of the clean text being lemmas
+        :return: None
+        """
+        chapter_counts = [
+            Counter(self.chapter_clean_text(chapter_row).split())
+            for chapter_row in range(len(self.chapter_numbers))
+        ]
+        book_counts = []
+        for book_row in range(len(self.book_names)):
+            book_count: Counter = Counter()
+            for chapter_row in self.chapter_rows(book_row):
+                book_count.update(chapter_counts[chapter_row])
+            book_counts.append(book_count)
+        lemmas = sorted({lemma for counts in chapter_counts for lemma in counts})
+        lemma_ids = {lemma: lemma_id for lemma_id, lemma in enumerate(lemmas)}
+        lemma_buffer, lemma_offsets = bytearray(), array("q", [0])
+        for lemma in lemmas:
+            lemma_buffer.extend(lemma.encode("utf-8"))
+            lemma_offsets.append(len(lemma_buffer))
+        self.lemma_buffer = bytes(lemma_buffer)
+        self.lemma_offsets = lemma_offsets
+        (
+            self.chapter_lemma_rows,
+            self.chapter_lemma_ids,
+            self.chapter_lemma_freqs,
+        ) = lemma_table(chapter_counts, lemma_ids)
+        (
+            self.book_lemma_rows,
+            self.book_lemma_ids,
+            self.book_lemma_freqs,
+        ) = lemma_table(book_counts, lemma_ids)
+
+    @property
+    def has_clean_text(self) -> bool:
+        return self.clean_buffer is not None
+
+    @property
+    def has_lemma_counts(self) -> bool:
+        return self.lemma_buffer is not None
+
+    @staticmethod
+    def _text(buffer: Buffer, spans: Buffer, row: int) -> str:
+        return str(buffer[spans[2 * row] : spans[2 * row + 1]], "utf-8")
+
+    def book_text(self, book_row: int) -> str:
+        return self._text(self.buffer, self.book_spans, book_row)
+
+    def chapter_text(self, chapter_row: int) -> str:
+        return self._text(self.buffer, self.chapter_spans, chapter_row)
+
+    def verse_text(self, verse_row: int) -> str:
+        return self._text(self.buffer, self.verse_spans, verse_row)
+
+    def book_clean_text(self, book_row: int) -> str:
+        return self._text(self.clean_buffer, self.clean_book_spans, book_row)
+
+    def chapter_clean_text(self, chapter_row: int) -> str:
+        return self._text(self.clean_buffer, self.clean_chapter_spans, chapter_row)
+
+    def verse_clean_text(self, verse_row: int) -> str:
+        return self._text(self.clean_buffer, self.clean_verse_spans, verse_row)
+
+    def lemma(self, lemma_id: int) -> str:
+        return str(
+            self.lemma_buffer[
+                self.lemma_offsets[lemma_id] : self.lemma_offsets[lemma_id + 1]
+            ],
+            "utf-8",
+        )
+
+    def _lemma_counts(
+        self, rows: Buffer, ids: Buffer, freqs: Buffer, row: int, k: Optional[int]
+    ) -> Dict[str, int]:
+        start, end = rows[row], rows[row + 1]
+        if k is not None:
+            end = min(end, start + k)
+        return {self.lemma(ids[i]): freqs[i] for i in range(start, end)}
+
+    def chapter_lemma_counts(
+        self, chapter_row: int, k: Optional[int] = None
+    ) -> Dict[str, int]:
+        """Lemma to count of a chapter, the k most frequent first, default all"""
+        return self._lemma_counts(
+            self.chapter_lemma_rows,
+            self.chapter_lemma_ids,
+            self.chapter_lemma_freqs,
+            chapter_row,
+            k,
+        )
+
+    def book_lemma_counts(
+        self, book_row: int, k: Optional[int] = None
+    ) -> Dict[str, int]:
+        """Lemma to count of a book, the k most frequent first, default all"""
+        return self._lemma_counts(
+            self.book_lemma_rows,
+            self.book_lemma_ids,
+            self.book_lemma_freqs,
+            book_row,
+            k,
+        )
+
+    def chapter_rows(self, book_row: int) -> range:
+        return range(self.book_chapters[book_row], self.book_chapters[book_row + 1])
+
+    def verse_rows(self, chapter_row: int) -> range:
+        return range(
+            self.chapter_verses[chapter_row], self.chapter_verses[chapter_row + 1]
+        )
+
+    def chapter_keys(self) -> List[Tuple[BookName, ChapterNum]]:
+        """(book name, chapter number) of every chapter row"""
+        return [
+            (book_name, self.chapter_numbers[chapter_row])
+            for book_row, book_name in enumerate(self.book_names)
+            for chapter_row in self.chapter_rows(book_row)
+        ]
+
+    def to_sections(self) -> Tuple[Dict, Dict[str, Buffer]]:
+        """Header and sections to write the corpus in a corpus file"""
+        header = {"language": self.language, "book_names": self.book_names}
+        sections = {
+            name: getattr(self, name)
+            for name in Corpus.SECTIONS
+            if getattr(self, name) is not None
+        }
+        return header, sections
+
+    @classmethod
+    def from_sections(cls, header: Dict, sections: Dict[str, Buffer]) -> "Corpus":
+        return cls(
+            language=header["language"],
+            book_names=header["book_names"],
+            **{name: sections.get(name) for name in Corpus.SECTIONS},
+        )
+
+
+def lemma_table(
+    counts: List[Counter], lemma_ids: Dict[str, int]
+) -> Tuple[array, array, array]:
+    """
+    Rows' lemma counts as offsets, lemma ids and counts
+    :param counts: lemma to count of every row
+    :param lemma_ids: lemma to its id
+    :return: offsets of the rows, lemma ids and counts, the most frequent first
+    """
+    rows, ids, freqs = array("q", [0]), array("q"), array("q")
+    for row_counts in counts:
+        for lemma, count in row_counts.most_common():
+            ids.append(lemma_ids[lemma])
+            freqs.append(count)
+        rows.append(len(ids))
+    return rows, ids, freqs
+
+
+def lemma_counts(clean_text: str, k: Optional[int] = None) -> Dict[str, int]:
+    """Lemma to count of a clean text, the k most frequent first, default all"""
+    return dict(Counter(clean_text.split()).most_common(k))
+
+
+def write_corpus_file(path: Path, header: Dict, sections: Dict[str, Buffer]) -> None:
+    """
+    Write a corpus file: a JSON header followed by aligned binary sections.
+    The file is replaced at once, processes reading the former one are not affected.
+    :param path: path of the corpus file
+    :param header: JSON serializable header
+    :param sections: name to bytes, array or numpy array
+    :return: None
+    """
+    views = {name: memoryview(section) for name, section in sections.items()}
+    table, offset = {}, 0
+    for name, view in views.items():
+        table[name] = [offset, view.nbytes, view.format]
+        offset += -(-view.nbytes // ALIGNMENT) * ALIGNMENT
+    file_header = dict(header, format=FILE_FORMAT, sections=table)
+    header_bytes = json.dumps(file_header).encode("utf-8")
+    data_start = len(MAGIC) + 8 + len(header_bytes)
+    data_start += -data_start % ALIGNMENT
+
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as out:
+        out.write(MAGIC)
+        out.write(struct.pack("<Q", len(header_bytes)))
+        out.write(header_bytes)
+        for name, view in views.items():
+            out.seek(data_start + table[name][0])
+            out.write(view.cast("B"))
+        out.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+
+
+def read_corpus_file(path: Path) -> Tuple[Dict, Dict[str, memoryview]]:
+    """
+    Memory-map a corpus file, read-only and shared by every process on the host
+    :param path: path of the corpus file
+    :return: header and name to memoryview of every section
+    :raise CorpusFormatError: if the file was written in another format
+    """
+    with open(path, "rb") as corpus_file:
+        mapped = mmap.mmap(corpus_file.fileno(), 0, access=mmap.ACCESS_READ)
+    if mapped[: len(MAGIC)] != MAGIC:
+        raise ValueError(f"Not a corpus file: {path}")
+    (header_size,) = struct.unpack("<Q", mapped[len(MAGIC) : len(MAGIC) + 8])
+    header_start = len(MAGIC) + 8
+    header = json.loads(mapped[header_start : header_start + header_size])
+    if header.get("format") != FILE_FORMAT:
+        raise CorpusFormatError(
+            f"Corpus file format {header.get('format')} is not {FILE_FORMAT}: {path}"
+        )
+    data_start = header_start + header_size
+    data_start += -data_start % ALIGNMENT
+    view = memoryview(mapped)
+    sections = {
+        name: view[data_start + offset : data_start + offset + size].cast(fmt)
+        for name, (offset, size, fmt) in header["sections"].items()
+    }
+    return header, sections
@@ -0,0 +1,162 @@
+"""Download, or import from files, the books of a bible's version"""
+import json
+import os
+import requests
+import tarfile
+import zipfile
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, MutableMapping, Optional, Tuple
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry  # type: ignore
+
+from ipybible.books import BOOKS
+
+BASE_URL = os.environ.get("IPYBIBLE_BASE_URL", "https://getbible.net/json")
+
+
+class BibleNotFound(Exception):
+    pass
+
+
+def parse_book(text: str, params: Dict) -> Dict:
+    """
+    Parse a book from the API's JSONP response
+    :param text: response's text
+    :param params: parameters of the request, for the error message
+    :return: a dictionary of chapter to verses
+    """
+    # The first character to skip is '(' and the last two characters ');'
+    clean_text = text[1:-2]
+    # NULL parsed as a single 'U'
+    if clean_text == "U":
+        raise BibleNotFound(f"NULL result. PARAMS={params}.")
+    try:
+        book_to_chapter: Dict = json.loads(clean_text)["book"]
+    except (KeyError, ValueError):
+        raise BibleNotFound(f"Error Book loaded. PARAMS={params}")
+    else:
+        return book_to_chapter
+
+
+@dataclass
+class BookDownloader:
+    """
+    Download books concurrently over a pooled keep-alive session,
+    retrying failed requests with an exponential backoff
+    """
+
+    base_url: str
+    workers: int = 8
+    timeout: float = 30.0
+    retries: int = 3
+    backoff_factor: float = 0.5
+
+    def session(self) -> requests.Session:
+        retry = Retry(
+            total=self.retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=self.workers, max_retries=retry
+        )
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def retrieve(
+        self, book: str, session: Optional[requests.Session] = None, **kwargs
+    ) -> Dict:
+        """
+        Retrieve a book from the base url
+        :param book: name of the book, e.g psalms
+        :param session: session to reuse, by default a new one closed afterwards
+        :param kwargs: parameters passed to the URL
+        :return: a dictionary of chapter to verses
+        """
+        if session is None:
+            # Closed along with its connections once the book is retrieved
+            with self.session() as session:
+                return self.retrieve(book, session, **kwargs)
+        params = dict(p=book, **kwargs)
+        resp = session.get(url=self.base_url, params=params, timeout=self.timeout)
+        return parse_book(resp.text, params)
+
+    def download(
+        self, books: Iterable[str], store: MutableMapping[str, Dict], **kwargs
+    ) -> None:
+        """
+        Download books concurrently, each one is stored as soon as it is retrieved.
+        Books already in the store are skipped, to resume a partial download.
+        :param books: names of the books
+        :param store: book's name to its dictionary of chapter to verses
+        :param kwargs: parameters passed to the URL, e.g version
+        :return: None
+        """
+        pending = [book for book in books if book not in store]
+        if not pending:
+            return
+        with self.session() as session, ThreadPoolExecutor(self.workers) as pool:
+            future_to_book = {
+                pool.submit(self.retrieve, book, session, **kwargs): book
+                for book in pending
+            }
+            try:
+                for future in as_completed(future_to_book):
+                    store[future_to_book[future]] = future.result()
+            except BaseException:
+                for future in future_to_book:
+                    future.cancel()
+                raise
+
+
+def book_order(book: str) -> Tuple[int, str]:
+    """Books in the bible's order, unknown books last"""
+    return (BOOKS.index(book), "") if book in BOOKS else (len(BOOKS), book)
+
+
+def read_books(path: Path) -> Iterator[Tuple[str, Dict]]:
+    """
+    Read books from per-book JSON files, e.g psalms.json, one file at a time.
+    The files are either in a directory or in a zip or tar archive,
+    and hold a dictionary of chapter to verses, as retrieved from the API.
+    :param path: directory or archive
+    :return: iterator of the book's name and its dictionary of chapter to verses
+    """
+
+    def load(json_file) -> Dict:
+        chapter_to_verse = json.load(json_file)
+        # A saved response of the API
+        return chapter_to_verse.get("book", chapter_to_verse)
+
+    path = Path(path)
+    if path.is_dir():
+        book_to_file = {file.stem: file for file in path.rglob("*.json")}
+        for book in sorted(book_to_file, key=book_order):
+            with open(book_to_file[book]) as json_file:
+                yield book, load(json_file)
+    elif zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            book_to_member = {
+                Path(name).stem: name
+                for name in archive.namelist()
+                if name.endswith(".json")
+            }
+            for book in sorted(book_to_member, key=book_order):
+                with archive.open(book_to_member[book]) as json_file:
+                    yield book, load(json_file)
+    elif tarfile.is_tarfile(str(path)):
+        with tarfile.open(path) as archive:
+            book_to_member = {
+                Path(member.name).stem: member
+                for member in archive.getmembers()
+                if member.isfile() and member.name.endswith(".json")
+            }
+            for book in sorted(book_to_member, key=book_order):
+                yield book, load(archive.extractfile(book_to_member[book]))
+    else:
+        raise BibleNotFound(f"Not a directory or an archive of books: {path}")
@@ -0,0 +1,559 @@
+"""Precomputed n-gram index to score a query against every chapter at once"""
+import numpy as np  # type: ignore
+
+from bisect import bisect_left
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+from uuid import uuid4
+from scipy.sparse import csc_matrix, csr_matrix, diags  # type: ignore
+from sklearn.feature_extraction.text import CountVectorizer  # type: ignore
+
+from ipybible.corpus import Buffer
+from ipybible.scoring import (
+    BM25Scorer,
+    CosineScorer,
+    DEFAULT_SCORING,
+    Scorer,
+    TfidfScorer,
+    bm25_idf,
+    bm25_tf,
+    row_norms,
+    scorer_class,
+    tfidf_idf,
+)
+from ipybible.similarity import NGRAM_RANGE, Query, cosine_scores, normalize_rows
+
+BookName = str
+ChapterNum = int
+
+
+class SortedVocabulary(Mapping):
+    """
+    Read-only n-gram to column mapping over the sorted UTF-8 n-grams,
+    looked up with a binary search instead of loading a dictionary.
+    The columns of a fitted CountVectorizer follow the sorted n-grams.
+    """
+
+    def __init__(self, terms: Buffer, offsets: Buffer):
+        self._terms = terms
+        self._offsets = offsets
+
+    def _term(self, column: int) -> bytes:
+        return bytes(self._terms[self._offsets[column] : self._offsets[column + 1]])
+
+    def __getitem__(self, ngram: str) -> int:
+        key = ngram.encode("utf-8")
+        column = bisect_left(_Terms(self), key)
+        if column < len(self) and self._term(column) == key:
+            return column
+        raise KeyError(ngram)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __iter__(self) -> Iterator[str]:
+        return (str(self._term(column), "utf-8") for column in range(len(self)))
+
+
+class _Terms:
+    """Sequence of the encoded n-grams of a SortedVocabulary, for bisect"""
+
+    def __init__(self, vocabulary: SortedVocabulary):
+        self._vocabulary = vocabulary
+
+    def __getitem__(self, column: int) -> bytes:
+        return self._vocabulary._term(column)
+
+    def __len__(self) -> int:
+        return len(self._vocabulary)
+
+
+@dataclass
+class NgramIndex:
+    """
+    Chapter x n-gram count matrix of a bible version.
+    Scores are computed for all chapters, and many queries, with one sparse
+    product, by a scorer of the counts fitted once per process: by default
+    the same cosine similarity as `similarity.cosine_sim`, or TF-IDF or BM25.
+    """
+
+    vocabulary: Mapping
+    matrix: csr_matrix
+    norms: np.ndarray
+    rows: List[Tuple[BookName, ChapterNum]]
+    book_to_rows: Dict[BookName, Tuple[int, int]] = field(default_factory=dict)
+    # Unique to every build, e.g to not read search results of a former index
+    build_id: str = field(default_factory=lambda: uuid4().hex)
+    # Same counts as the matrix, by n-gram: the rows holding every n-gram
+    postings: Optional[csc_matrix] = None
+    # Scorers of the matrix, by scoring's name
+    _scorers: Dict[str, Scorer] = field(default_factory=dict, repr=False)
+
+    def __post_init__(self):
+        if not self.book_to_rows:
+            for row, (book_name, _) in enumerate(self.rows):
+                start, _ = self.book_to_rows.get(book_name, (row, row))
+                self.book_to_rows[book_name] = (start, row + 1)
+        if self.postings is None:
+            self.postings = csc_matrix(self.matrix)
+        self.book_names = list(self.book_to_rows)
+        # Book of every row, as an index of book_names
+        self.row_books = np.zeros(len(self.rows), dtype=np.int64)
+        for book, (start, end) in enumerate(self.book_to_rows.values()):
+            self.row_books[start:end] = book
+
+    @classmethod
+    def build(
+        cls, rows: List[Tuple[BookName, ChapterNum]], texts: List[str]
+    ) -> "NgramIndex":
+        """
+        Fit the n-gram vocabulary on cleaned chapter texts
+        :param rows: (book name, chapter number) of every text
+        :param texts: cleaned chapter texts
+        :return: NgramIndex
+        """
+        vectorizer = CountVectorizer(ngram_range=NGRAM_RANGE)
+        matrix = csr_matrix(vectorizer.fit_transform(texts), dtype=np.float64)
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        return cls(
+            vocabulary=dict(vectorizer.vocabulary_),
+            matrix=matrix,
+            norms=norms,
+            rows=list(rows),
+        )
+
+    def query_terms(self, query: Query) -> Tuple[np.ndarray, np.ndarray, float]:
+        """
+        Columns and counts of the query's n-grams known to the index
+        :param query: prepared query
+        :return: columns, counts and the norm of the query
+        """
+        # The query norm includes n-grams unknown to the corpus,
+        # just like fitting a vectorizer on the query and a chapter
+        query_norm = np.sqrt(sum(c * c for c in query.ngram_counts.values()))
+        known = [
+            (self.vocabulary[ngram], count)
+            for ngram, count in query.ngram_counts.items()
+            if ngram in self.vocabulary
+        ]
+        cols, counts = zip(*known) if known else ((), ())
+        return (
+            np.array(cols, dtype=np.int64),
+            np.array(counts, dtype=np.float64),
+            query_norm,
+        )
+
+    def query_matrix(self, queries: List[Query]) -> Tuple[csr_matrix, np.ndarray]:
+        """
+        Query x n-gram counts of the n-grams known to the index
+        :param queries: prepared queries
+        :return: sparse matrix, one row per query, and the norms of the queries
+        """
+        data, indices, indptr, query_norms = [], [], [0], []
+        for query in queries:
+            cols, counts, query_norm = self.query_terms(query)
+            data.append(counts)
+            indices.append(cols)
+            indptr.append(indptr[-1] + len(cols))
+            query_norms.append(query_norm)
+        matrix = csr_matrix(
+            (
+                np.concatenate(data or [np.zeros(0)]),
+                np.concatenate(indices or [np.zeros(0, dtype=np.int64)]),
+                np.array(indptr),
+            ),
+            shape=(len(queries), self.matrix.shape[1]),
+        )
+        return matrix, np.array(query_norms, dtype=np.float64)
+
+    def scorer(self, scoring: str = DEFAULT_SCORING) -> Scorer:
+        """Scorer of the chapters, fitted on first use"""
+        if scoring not in self._scorers:
+            self._scorers[scoring] = scorer_class(scoring)(self.matrix)
+        return self._scorers[scoring]
+
+    def scores(
+        self,
+        query: Query,
+        scoring: str = DEFAULT_SCORING,
+        rows: slice = slice(None),
+    ) -> np.ndarray:
+        """
+        Similarity of a query against every chapter
+        :param query: prepared query
+        :param scoring: name of the scoring, see `scoring.SCORINGS`
+        :param rows: rows to score, e.g of some books, default to all
+        :return: an array of similarity ratios, one per row
+        """
+        return self.scores_many([query], scoring=scoring, rows=rows)[0]
+
+    def scores_many(
+        self,
+        queries: List[Query],
+        scoring: str = DEFAULT_SCORING,
+        rows: slice = slice(None),
+    ) -> np.ndarray:
+        """
+        Similarity of many queries against every chapter
+        :param queries: prepared queries
+        :param scoring: name of the scoring, see `scoring.SCORINGS`
+        :param rows: rows to score, e.g of some books, default to all
+        :return: a query x row array of similarity ratios
+        """
+        return self.scorer(scoring).scores_many(*self.query_matrix(queries), rows=rows)
+
+    def top_rows(
+        self,
+        query: Query,
+        k: int,
+        groups: Optional[np.ndarray] = None,
+        scoring: str = DEFAULT_SCORING,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The k best rows, or groups of rows, by similarity.
+        By cosine similarity, the query's n-grams are visited from the highest count
+        and only the rows in their postings are scored. Once the n-grams left cannot
+        reach the k-th best score, the rows holding none of the visited n-grams are
+        skipped. Other scorings score every row.
+        :param query: prepared query
+        :param k: number of rows, or groups
+        :param groups: group of every row, e.g row_books; a group's score is
+                       the best score of its rows
+        :param scoring: name of the scoring, see `scoring.SCORINGS`
+        :return: rows, or groups, and their scores from the highest, scores > 0 only
+        """
+        cols, counts, query_norm = self.query_terms(query)
+        num_groups = len(self.rows) if groups is None else int(groups.max()) + 1
+        best = np.zeros(num_groups)
+        if k <= 0 or not len(cols):
+            return np.zeros(0, dtype=np.int64), best[:0]
+        if scorer_class(scoring) is not CosineScorer:
+            scores = self.scores(query, scoring=scoring)
+            if groups is None:
+                best = scores
+            else:
+                np.maximum.at(best, groups, scores)
+            return top_scores(best, k)
+        order = np.argsort(-counts, kind="stable")
+        cols, counts = cols[order], counts[order]
+        # Highest score of a row holding only the n-grams from the i-th on,
+        # by Cauchy-Schwarz: q.r <= |q restricted to these n-grams| |r|
+        bounds = np.sqrt(np.cumsum((counts ** 2)[::-1])[::-1]) / query_norm
+        query_row = normalize_rows(*self.query_matrix([query]))
+        documents = self.scorer(scoring).documents
+        scored = np.zeros(len(self.rows), dtype=bool)
+        for col, bound in zip(cols, bounds):
+            found = np.count_nonzero(best)
+            if found >= k and bound <= np.partition(best, num_groups - k)[-k]:
+                break
+            start, end = self.postings.indptr[col], self.postings.indptr[col + 1]
+            rows = np.asarray(self.postings.indices[start:end])
+            rows = rows[~scored[rows]]
+            if not len(rows):
+                continue
+            scored[rows] = True
+            row_scores = cosine_scores(query_row, documents[rows])
+            if groups is None:
+                best[rows] = row_scores
+            else:
+                np.maximum.at(best, groups[rows], row_scores)
+        return top_scores(best, k)
+
+    def book_scores(self, scores: np.ndarray) -> np.ndarray:
+        """Best score of every book's rows, in the order of book_names"""
+        best = np.zeros(len(self.book_names))
+        np.maximum.at(best, self.row_books, scores)
+        return best
+
+    def book_rows(self, book_name: BookName) -> slice:
+        """Rows of the chapters of a book"""
+        return slice(*self.book_to_rows.get(book_name, (0, 0)))
+
+    def to_sections(self) -> Tuple[Dict, Dict[str, Buffer]]:
+        """Header and sections to write the index in a corpus file"""
+        ngrams = self.vocabulary
+        if isinstance(ngrams, dict):
+            ngrams = sorted(ngrams, key=ngrams.__getitem__)
+        terms = [ngram.encode("utf-8") for ngram in ngrams]
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(term) for term in terms], out=offsets[1:])
+        header = {
+            "ngram_shape": list(self.matrix.shape),
+            "ngram_build_id": self.build_id,
+        }
+        sections = {
+            "ngram_terms": b"".join(terms),
+            "ngram_offsets": offsets,
+            "ngram_data": self.matrix.data,
+            "ngram_indices": self.matrix.indices,
+            "ngram_indptr": self.matrix.indptr,
+            "ngram_norms": self.norms,
+            "ngram_postings_data": self.postings.data,
+            "ngram_postings_indices": self.postings.indices,
+            "ngram_postings_indptr": self.postings.indptr,
+        }
+        return header, sections
+
+    @classmethod
+    def from_sections(
+        cls,
+        header: Dict,
+        sections: Dict[str, Buffer],
+        rows: List[Tuple[BookName, ChapterNum]],
+    ) -> "NgramIndex":
+        """Index over the (memory-mapped) sections of a corpus file"""
+        matrix = csr_matrix(
+            (
+                np.asarray(sections["ngram_data"]),
+                np.asarray(sections["ngram_indices"]),
+                np.asarray(sections["ngram_indptr"]),
+            ),
+            shape=tuple(header["ngram_shape"]),
+            copy=False,
+        )
+        postings = csc_matrix(
+            (
+                np.asarray(sections["ngram_postings_data"]),
+                np.asarray(sections["ngram_postings_indices"]),
+                np.asarray(sections["ngram_postings_indptr"]),
+            ),
+            shape=matrix.shape,
+            copy=False,
+        )
+        return cls(
+            vocabulary=SortedVocabulary(
+                sections["ngram_terms"], sections["ngram_offsets"]
+            ),
+            matrix=matrix,
+            norms=np.asarray(sections["ngram_norms"]),
+            rows=rows,
+            build_id=header.get("ngram_build_id", ""),
+            postings=postings,
+        )
+
+
+def top_scores(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The k best scores of an array, without sorting the others
+    :param scores: scores, e.g of rows
+    :param k: number of scores
+    :return: positions and scores from the highest, scores > 0 only
+    """
+    top = np.flatnonzero(scores > 0)
+    if len(top) > k:
+        top = top[np.argpartition(-scores[top], k - 1)[:k]]
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return top, scores[top]
+
+
+def varint_sizes(values: np.ndarray) -> np.ndarray:
+    """Number of bytes of every integer encoded as a varint"""
+    sizes = np.ones(len(values), dtype=np.int64)
+    rest = np.asarray(values, dtype=np.uint64) >> np.uint64(7)
+    while rest.any():
+        sizes += rest > 0
+        rest >>= np.uint64(7)
+    return sizes
+
+
+def encode_varints(values: np.ndarray) -> bytes:
+    """
+    Encode non-negative integers as LEB128 varints: 7 bits per byte,
+    the high bit set on every byte but the last of a value
+    :param values: integers
+    :return: encoded bytes
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = varint_sizes(values)
+    starts = np.zeros(len(values), dtype=np.int64)
+    np.cumsum(sizes[:-1], out=starts[1:])
+    encoded = np.zeros(int(sizes.sum()), dtype=np.uint8)
+    for byte in range(int(sizes.max(initial=0))):
+        has_byte = sizes > byte
+        groups = (values[has_byte] >> np.uint64(7 * byte)) & np.uint64(0x7F)
+        more = (sizes[has_byte] > byte + 1).astype(np.uint64) << np.uint64(7)
+        encoded[starts[has_byte] + byte] = groups | more
+    return encoded.tobytes()
+
+
+def decode_varints(encoded: Buffer) -> np.ndarray:
+    """
+    Decode LEB128 varints, see `encode_varints`
+    :param encoded: encoded bytes
+    :return: integers
+    """
+    data = np.frombuffer(encoded, dtype=np.uint8)
+    if not len(data):
+        return np.zeros(0, dtype=np.int64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    shifts = 7 * (np.arange(len(data)) - np.repeat(starts, ends - starts + 1))
+    groups = (data & 0x7F).astype(np.int64) << shifts
+    return np.add.reduceat(groups, starts)
+
+
+@dataclass
+class VerseIndex:
+    """
+    Inverted index of the verses of a bible version: every n-gram maps to its
+    postings, the (verse row, count) of the verses holding it.
+    Postings are varints in one buffer, verse rows delta encoded,
+    postings[offsets[column]:offsets[column + 1]] being those of an n-gram.
+    Scores are those of the chapters' scorers, over the verses' statistics,
+    and only the verses sharing an n-gram with the query are scored.
+    """
+
+    vocabulary: Mapping
+    postings: Buffer
+    offsets: np.ndarray
+    norms: np.ndarray
+    # Number of n-grams and TF-IDF norm of every verse
+    lengths: np.ndarray
+    tfidf_norms: np.ndarray
+
+    def __post_init__(self):
+        self.average_length = self.lengths.mean() if len(self.lengths) else 0.0
+
+    @classmethod
+    def build(cls, vocabulary: Mapping, texts: List[str]) -> "VerseIndex":
+        """
+        Index cleaned verse texts, over the vocabulary of their chapters
+        :param vocabulary: n-gram to column, of the chapters' NgramIndex
+        :param texts: cleaned text of every verse row
+        :return: VerseIndex
+        """
+        # The n-grams of a verse are n-grams of its chapter
+        vectorizer = CountVectorizer(
+            ngram_range=NGRAM_RANGE, vocabulary=dict(vocabulary)
+        )
+        matrix = csc_matrix(vectorizer.transform(texts), dtype=np.int64)
+        matrix.sort_indices()
+        document_frequencies = np.diff(matrix.indptr)
+        idf = diags(tfidf_idf(document_frequencies, matrix.shape[0]))
+        # The first verse row of every n-gram is kept, the next ones are deltas
+        deltas = np.diff(matrix.indices, prepend=0)
+        column_starts = matrix.indptr[:-1][np.diff(matrix.indptr) > 0]
+        deltas[column_starts] = matrix.indices[column_starts]
+        pairs = np.empty(2 * len(deltas), dtype=np.int64)
+        pairs[0::2], pairs[1::2] = deltas, matrix.data
+        pair_offsets = np.zeros(len(pairs) + 1, dtype=np.int64)
+        np.cumsum(varint_sizes(pairs), out=pair_offsets[1:])
+        return cls(
+            vocabulary=vocabulary,
+            postings=encode_varints(pairs),
+            offsets=pair_offsets[2 * matrix.indptr],
+            norms=row_norms(matrix),
+            lengths=np.asarray(matrix.sum(axis=1), dtype=np.float64).ravel(),
+            tfidf_norms=row_norms(matrix.dot(idf)),
+        )
+
+    def verse_postings(self, column: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Decode the postings of an n-gram
+        :param column: column of the n-gram
+        :return: verse rows and counts
+        """
+        pairs = decode_varints(
+            self.postings[self.offsets[column] : self.offsets[column + 1]]
+        )
+        return np.cumsum(pairs[0::2]), pairs[1::2]
+
+    def scores(
+        self, query: Query, scoring: str = DEFAULT_SCORING, rows: slice = slice(None)
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Similarity of a query against the verses sharing an n-gram with it
+        :param query: prepared query
+        :param scoring: name of the scoring, see `scoring.SCORINGS`
+        :param rows: verse rows to score, e.g a chapter's, default to all.
+                     Their scores are those of a search of every verse.
+        :return: verse rows, in order, and their similarity ratios
+        """
+        scorer = scorer_class(scoring)
+        num_verses = len(self.norms)
+        start, stop, _ = rows.indices(num_verses)
+        dots = np.zeros(max(stop - start, 0))
+        # Norm of the query's n-grams found in the verses, for TF-IDF
+        squares = 0.0
+        for ngram, count in query.ngram_counts.items():
+            column = self.vocabulary.get(ngram)
+            if column is None:
+                continue
+            verse_rows, counts = self.verse_postings(column)
+            document_frequency = len(verse_rows)
+            if not document_frequency:
+                continue
+            if scorer is TfidfScorer:
+                weight = count * tfidf_idf(document_frequency, num_verses)
+                squares += weight * weight
+            # Verse rows are sorted, those to score are a slice of them
+            first, last = np.searchsorted(verse_rows, (start, stop))
+            verse_rows, counts = verse_rows[first:last], counts[first:last]
+            if scorer is TfidfScorer:
+                dots[verse_rows - start] += (
+                    weight * counts * tfidf_idf(document_frequency, num_verses)
+                )
+            elif scorer is BM25Scorer:
+                dots[verse_rows - start] += (
+                    count
+                    * bm25_idf(document_frequency, num_verses)
+                    * bm25_tf(counts, self.lengths[verse_rows], self.average_length)
+                )
+            else:
+                dots[verse_rows - start] += count * counts
+        nonzero = np.flatnonzero(dots)
+        verse_rows = nonzero + start
+        if scorer is TfidfScorer:
+            return (
+                verse_rows,
+                dots[nonzero] / (self.tfidf_norms[verse_rows] * np.sqrt(squares)),
+            )
+        if scorer is BM25Scorer:
+            return verse_rows, dots[nonzero]
+        query_norm = np.sqrt(sum(c * c for c in query.ngram_counts.values()))
+        return verse_rows, dots[nonzero] / (self.norms[verse_rows] * query_norm)
+
+    def top_verses(
+        self, query: Query, k: int, scoring: str = DEFAULT_SCORING
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The k best verses of a query
+        :param query: prepared query
+        :param k: number of verses
+        :param scoring: name of the scoring, see `scoring.SCORINGS`
+        :return: verse rows and their scores, from the highest
+        """
+        rows, scores = self.scores(query, scoring=scoring)
+        if k <= 0:
+            return rows[:0], scores[:0]
+        if len(rows) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[top], scores[top]
+        order = np.lexsort((rows, -scores))
+        return rows[order], scores[order]
+
+    def to_sections(self) -> Tuple[Dict, Dict[str, Buffer]]:
+        """Sections to write the index in a corpus file, after its NgramIndex"""
+        sections = {
+            "verse_postings": self.postings,
+            "verse_offsets": self.offsets,
+            "verse_norms": self.norms,
+            "verse_lengths": self.lengths,
+            "verse_tfidf_norms": self.tfidf_norms,
+        }
+        return {}, sections
+
+    @classmethod
+    def from_sections(
+        cls, sections: Dict[str, Buffer], vocabulary: Mapping
+    ) -> "VerseIndex":
+        """Index over the (memory-mapped) sections of a corpus file"""
+        return cls(
+            vocabulary=vocabulary,
+            postings=sections["verse_postings"],
+            offsets=np.asarray(sections["verse_offsets"]),
+            norms=np.asarray(sections["verse_norms"]),
+            lengths=np.asarray(sections["verse_lengths"]),
+            tfidf_norms=np.asarray(sections["verse_tfidf_norms"]),
+        )
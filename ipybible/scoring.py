@@ -0,0 +1,197 @@
+"""
+Scoring backends: similarity of queries to the documents of an n-gram count
+matrix, e.g chapters, from statistics of the documents computed once
+"""
+import abc
+import numpy as np  # type: ignore
+
+from dataclasses import dataclass
+from typing import ClassVar, Dict, List, Optional, Type
+from scipy.sparse import csr_matrix, diags  # type: ignore
+
+from ipybible.scorings import DEFAULT_SCORING, SCORINGS
+from ipybible.similarity import (
+    cosine_scores,
+    cosine_sims,
+    normalize_rows,
+    vectorize_sparse,
+)
+
+# Saturation of the n-gram counts and normalization of the document lengths
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def row_norms(matrix: csr_matrix) -> np.ndarray:
+    """L2 norm of every row of a sparse matrix"""
+    return np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+
+
+def tfidf_idf(document_frequencies: np.ndarray, num_documents: int) -> np.ndarray:
+    """Smoothed inverse document frequency, as sklearn's TfidfTransformer"""
+    return np.log((1 + num_documents) / (1 + document_frequencies)) + 1
+
+
+def bm25_idf(document_frequencies: np.ndarray, num_documents: int) -> np.ndarray:
+    """BM25 inverse document frequency, kept positive for the most common n-grams"""
+    return np.log(
+        1 + (num_documents - document_frequencies + 0.5) / (document_frequencies + 0.5)
+    )
+
+
+def bm25_tf(
+    counts: np.ndarray, lengths: np.ndarray, average_length: float
+) -> np.ndarray:
+    """BM25 weight of n-gram counts in documents of some lengths"""
+    length_ratios = lengths / average_length if average_length else 1.0
+    saturation = BM25_K1 * (1 - BM25_B + BM25_B * length_ratios)
+    return counts * (BM25_K1 + 1) / (counts + saturation)
+
+
+@dataclass
+class Scorer(abc.ABC):
+    """
+    Similarity of queries to the documents of an n-gram count matrix.
+    Queries are n-gram counts over the same columns as the documents.
+    """
+
+    NAME: ClassVar[str] = ""
+
+    matrix: csr_matrix
+
+    def __post_init__(self):
+        self.num_documents = self.matrix.shape[0]
+        self.document_frequencies = np.bincount(
+            np.asarray(self.matrix.indices), minlength=self.matrix.shape[1]
+        )
+
+    @abc.abstractmethod
+    def scores_many(
+        self,
+        queries: csr_matrix,
+        query_norms: Optional[np.ndarray] = None,
+        rows: slice = slice(None),
+    ) -> np.ndarray:
+        """
+        Scores of many queries against every document
+        :param queries: query x n-gram counts
+        :param query_norms: L2 norm of every query's counts, including the n-grams
+                            unknown to the documents, default to the queries' rows
+        :param rows: documents to score, e.g some books' chapters, default to all
+        :return: a query x document array of scores
+        """
+
+    def _scores(
+        self, queries: csr_matrix, documents: csr_matrix, rows: slice
+    ) -> np.ndarray:
+        documents = documents[rows]
+        scores = cosine_scores(queries, documents)
+        return scores.reshape(queries.shape[0], documents.shape[0])
+
+
+@dataclass
+class CosineScorer(Scorer):
+    """Cosine similarity of the raw n-gram counts, as `similarity.cosine_sim`"""
+
+    NAME: ClassVar[str] = "cosine"
+
+    def __post_init__(self):
+        super().__post_init__()
+        self.documents = normalize_rows(self.matrix)
+
+    def scores_many(
+        self,
+        queries: csr_matrix,
+        query_norms: Optional[np.ndarray] = None,
+        rows: slice = slice(None),
+    ) -> np.ndarray:
+        return self._scores(normalize_rows(queries, query_norms), self.documents, rows)
+
+
+@dataclass
+class TfidfScorer(Scorer):
+    """
+    Cosine similarity of the n-gram counts weighted by their inverse document
+    frequency: n-grams found in few documents count more
+    """
+
+    NAME: ClassVar[str] = "tfidf"
+
+    def __post_init__(self):
+        super().__post_init__()
+        # As a fitted TfidfVectorizer, n-grams unknown to the documents are ignored
+        idf = tfidf_idf(self.document_frequencies, self.num_documents)
+        self.idf = diags(np.where(self.document_frequencies > 0, idf, 0.0))
+        self.documents = normalize_rows(self.matrix.dot(self.idf))
+
+    def scores_many(
+        self,
+        queries: csr_matrix,
+        query_norms: Optional[np.ndarray] = None,
+        rows: slice = slice(None),
+    ) -> np.ndarray:
+        return self._scores(normalize_rows(queries.dot(self.idf)), self.documents, rows)
+
+
+@dataclass
+class BM25Scorer(Scorer):
+    """
+    Okapi BM25: sum of the query's n-grams weights in a document, saturating
+    with their counts and lower in longer documents. Scores are not bounded.
+    """
+
+    NAME: ClassVar[str] = "bm25"
+
+    def __post_init__(self):
+        super().__post_init__()
+        matrix = csr_matrix(self.matrix, dtype=np.float64)
+        lengths = np.asarray(matrix.sum(axis=1)).ravel()
+        average_length = lengths.mean() if len(lengths) else 0.0
+        value_rows = np.repeat(np.arange(self.num_documents), np.diff(matrix.indptr))
+        idf = bm25_idf(self.document_frequencies, self.num_documents)
+        self.documents = csr_matrix(
+            (
+                bm25_tf(matrix.data, lengths[value_rows], average_length)
+                * idf[matrix.indices],
+                matrix.indices,
+                matrix.indptr,
+            ),
+            shape=matrix.shape,
+        )
+
+    def scores_many(
+        self,
+        queries: csr_matrix,
+        query_norms: Optional[np.ndarray] = None,
+        rows: slice = slice(None),
+    ) -> np.ndarray:
+        return self._scores(csr_matrix(queries, dtype=np.float64), self.documents, rows)
+
+
+SCORERS: Dict[str, Type[Scorer]] = {
+    scorer.NAME: scorer for scorer in (CosineScorer, TfidfScorer, BM25Scorer)
+}
+
+
+def scorer_class(scoring: str) -> Type[Scorer]:
+    """Scorer of a scoring's name, e.g bm25"""
+    if scoring not in SCORERS:
+        raise ValueError(f"Scoring not in {SCORINGS}: {scoring}")
+    return SCORERS[scoring]
+
+
+def score_texts(
+    text: str, texts: List[str], scoring: str = DEFAULT_SCORING
+) -> np.ndarray:
+    """
+    Scores of a text, e.g a query, against texts without precomputed statistics,
+    the statistics being those of these texts
+    :param text: text
+    :param texts: texts to score
+    :param scoring: name of the scoring, see SCORINGS
+    :return: an array of scores, one per text
+    """
+    if scorer_class(scoring) is CosineScorer:
+        return cosine_sims(text, texts)
+    counts = vectorize_sparse(text.lower(), *(other.lower() for other in texts))
+    return scorer_class(scoring)(counts[1:]).scores_many(counts[:1])[0]
@@ -0,0 +1,5 @@
+"""Names of the scorings, read without importing the scorers, e.g by the CLI"""
+
+# Names of the scorers of `scoring.SCORERS`, in the same order
+SCORINGS = ("cosine", "tfidf", "bm25")
+DEFAULT_SCORING = "cosine"
@@ -1,18 +1,38 @@
 import numpy as np  # type: ignore
+import os
 import spacy  # type: ignore
 
-from typing import List
+from functools import lru_cache
+from threading import Lock
+from typing import (
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    MutableMapping,
+    Optional,
+    Tuple,
+)
 from spacy.tokens.doc import Doc  # type: ignore
+from scipy.sparse import csr_matrix, diags  # type: ignore
 from sklearn.feature_extraction.text import CountVectorizer  # type: ignore
-from sklearn.metrics.pairwise import cosine_similarity  # type: ignore
-from diskcache import Cache, Index  # type: ignore
-from dataclasses import dataclass
+from diskcache import Cache  # type: ignore
+from collections import Counter
+from dataclasses import dataclass, field
 from hashlib import sha256
 
-from ipybible import BIBLE_DATA_DIR
+from ipybible.store import TEXT, LRUIndex, get_many, set_many
 
 SIM_CACHE: Cache = Cache()
-BIBLE_INDEX = Index(str(BIBLE_DATA_DIR))
+# Clean texts, the most recently used ones are kept in memory
+TEXT_INDEX = LRUIndex(
+    TEXT.open(), maxsize=int(os.environ.get("IPYBIBLE_TEXT_CACHE_SIZE", 10000))
+)
+# Word n-grams compared between a query and a text
+NGRAM_RANGE: Tuple[int, int] = (2, 3)
 
 
 @dataclass
@@ -21,24 +41,198 @@ class SpacyLangModel:
     stop_words: List[str]
 
 
+@dataclass
+class SpacyModels(Mapping):
+    """
+    Language to its spacy model, loaded the first time the language is used.
+    Only the components needed for the lemmas are kept,
+    the parser and the named entities are not loaded.
+    """
+
+    language_to_name: Dict[str, str]
+    disable: Tuple[str, ...] = ("parser", "ner")
+    _models: Dict[str, SpacyLangModel] = field(default_factory=dict, repr=False)
+    _lock: Lock = field(default_factory=Lock, repr=False)
+
+    def __getitem__(self, language: str) -> SpacyLangModel:
+        if language not in self._models:
+            model_name = self.language_to_name[language]
+            with self._lock:
+                if language not in self._models:
+                    nlp = spacy.load(model_name, disable=list(self.disable))
+                    self._models[language] = SpacyLangModel(
+                        nlp=nlp, stop_words=nlp.Defaults.stop_words
+                    )
+        return self._models[language]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.language_to_name)
+
+    def __len__(self) -> int:
+        return len(self.language_to_name)
+
+    def is_loaded(self, language: str) -> bool:
+        return language in self._models
+
+    def preload(self, *languages: str) -> None:
+        """
+        Load models ahead of their first use, e.g at startup
+        :param languages: languages to load, default to all of them
+        :return: None
+        """
+        for language in languages or tuple(self.language_to_name):
+            self[language]
+
+
+def text_key(text: str) -> str:
+    return sha256(text.encode("utf-8")).hexdigest()
+
+
+def clean_doc(doc: Doc) -> str:
+    """
+    Join the lemmas of a parsed text, without punctuations and stop words
+    :param doc: spacy doc
+    :return: clean text
+    """
+    lemma_words: List[str] = []
+    for token in doc:
+        if token.is_punct or token.is_stop:
+            continue
+        lemma = token.lemma_.strip()
+        if "-PRON-" not in lemma:
+            lemma_words.append(lemma)
+    return " ".join(lemma_words)
+
+
 def normalize_text(
-    text: str, spacy_model: SpacyLangModel, index_name: Index = BIBLE_INDEX
+    text: str,
+    spacy_model: SpacyLangModel,
+    index_name: MutableMapping = TEXT_INDEX,
+    key: Optional[Hashable] = None,
+    expire: Optional[float] = None,
 ):
-    index_key = sha256(text.encode("utf-8")).hexdigest()
-    if index_key in index_name:
-        return BIBLE_INDEX[index_key]
-    else:
+    """
+    Clean a text, cached in an index
+    :param text: text to clean
+    :param spacy_model: spacy model of the text's language
+    :param index_name: index caching normalized texts
+    :param key: key of the clean text in the index, default to the text's hash
+    :param expire: seconds until the clean text expires from the index, if supported
+    :return: clean text
+    """
+    index_key = text_key(text) if key is None else key
+    clean_text = index_name.get(index_key)
+    if clean_text is None:
         doc: Doc = spacy_model.nlp(text.lower())
-        lemma_words: List[str] = []
-        for token in doc:
-            if token.is_punct or token.is_stop:
+        clean_text = clean_doc(doc)
+        if expire is not None and hasattr(index_name, "set"):
+            index_name.set(index_key, clean_text, expire=expire)
+        else:
+            index_name[index_key] = clean_text
+    return clean_text
+
+
+def normalize_texts(
+    texts: Iterable[str],
+    spacy_model: SpacyLangModel,
+    index_name: MutableMapping = TEXT_INDEX,
+    batch_size: int = 1000,
+    n_process: int = 1,
+) -> Iterator[str]:
+    """
+    Normalize many texts, streaming the uncached ones through spacy in batches.
+    Cached texts are read, and clean texts written, in bulk.
+    :param texts: texts to normalize
+    :param spacy_model: spacy model of the texts' language
+    :param index_name: index caching normalized texts
+    :param batch_size: number of texts per spacy batch
+    :param n_process: number of spacy processes, more than 1 needs spacy>=2.2
+    :return: iterator of clean texts, in the order of the given texts
+    """
+    texts = list(texts)
+    index_keys = [text_key(text) for text in texts]
+    cached = get_many(index_name, set(index_keys))
+    missing: Dict[str, str] = {}
+    for index_key, text in zip(index_keys, texts):
+        if index_key not in cached:
+            missing.setdefault(index_key, text)
+    pipe_kwargs = {"batch_size": batch_size}
+    # Not an argument of spacy before 2.2, texts are cleaned in this process then
+    if n_process > 1:
+        pipe_kwargs["n_process"] = n_process
+    docs = spacy_model.nlp.pipe(
+        (text.lower() for text in missing.values()), **pipe_kwargs
+    )
+    missing_docs = zip(missing.keys(), docs)
+    cleaned: Dict[str, str] = {}
+    unsaved: List[Tuple[str, str]] = []
+    try:
+        for index_key in index_keys:
+            if index_key in cached:
+                yield cached[index_key]
                 continue
-            lemma = token.lemma_.strip()
-            if "-PRON-" not in lemma:
-                lemma_words.append(lemma)
-        clean_text = " ".join(lemma_words)
-        BIBLE_INDEX[index_key] = clean_text
-        return clean_text
+            # Docs come out in the same order as the missing texts
+            while index_key not in cleaned:
+                missing_key, doc = next(missing_docs)
+                cleaned[missing_key] = clean_doc(doc)
+                unsaved.append((missing_key, cleaned[missing_key]))
+                if len(unsaved) >= batch_size:
+                    set_many(index_name, unsaved)
+                    unsaved = []
+            yield cleaned[index_key]
+    finally:
+        set_many(index_name, unsaved)
+
+
+def analyze_ngrams(text: str) -> List[str]:
+    """
+    Split a text into its word n-grams, as used by `vectorize`
+    :param text: (clean) text
+    :return: list of n-grams
+    """
+    return ngram_analyzer()(text)
+
+
+@lru_cache(maxsize=None)
+def ngram_analyzer() -> Callable[[str], List[str]]:
+    return CountVectorizer(ngram_range=NGRAM_RANGE).build_analyzer()
+
+
+@dataclass(frozen=True)
+class Query:
+    """A search query, normalized and vectorized once"""
+
+    text: str
+    clean_text: str
+    ngram_counts: Dict[str, int] = field(init=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(
+            self, "ngram_counts", dict(Counter(analyze_ngrams(self.clean_text)))
+        )
+
+    @classmethod
+    def prepare(
+        cls,
+        text: str,
+        spacy_model: SpacyLangModel,
+        index_name: MutableMapping = TEXT_INDEX,
+    ) -> "Query":
+        """
+        Normalize and vectorize a query text
+        :param text: query text
+        :param spacy_model: spacy model of the query's language
+        :param index_name: index caching normalized texts
+        :return: Query
+        """
+        # Queries typed by users expire, the texts of the bible do not
+        clean_text = normalize_text(
+            text=text,
+            spacy_model=spacy_model,
+            index_name=index_name,
+            expire=TEXT.query_ttl,
+        )
+        return cls(text=text, clean_text=clean_text)
 
 
 def cosine_sim(str_a: str, str_b: str) -> float:
@@ -49,8 +243,50 @@ def cosine_sim(str_a: str, str_b: str) -> float:
     :return: a similarity ratio
     """
     str_a, str_b = str_a.lower(), str_b.lower()
-    vectors = [t for t in vectorize(str_a, str_b)]
-    return float(cosine_similarity(vectors)[0, 1])
+    vectors = normalize_rows(vectorize_sparse(str_a, str_b))
+    return float(cosine_scores(vectors[0], vectors[1])[0])
+
+
+def cosine_sims(text: str, texts: List[str]) -> np.ndarray:
+    """
+    Cosine similarity of a text against many texts, as `cosine_sim` of every pair,
+    with one vectorizer fit and one sparse product
+    :param text: text, e.g of a query
+    :param texts: texts to compare it with
+    :return: an array of similarity ratios, one per text
+    """
+    vectors = normalize_rows(
+        vectorize_sparse(text.lower(), *(other.lower() for other in texts))
+    )
+    return cosine_scores(vectors[0], vectors[1:])
+
+
+def normalize_rows(
+    matrix: csr_matrix, norms: Optional[np.ndarray] = None
+) -> csr_matrix:
+    """
+    Scale the rows of a sparse matrix to a unit L2 norm, empty rows stay empty
+    :param matrix: sparse matrix, e.g of n-gram counts
+    :param norms: L2 norm of every row, if known
+    :return: sparse matrix of unit rows
+    """
+    matrix = csr_matrix(matrix, dtype=np.float64)
+    if norms is None:
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    scales = np.zeros(len(norms))
+    np.divide(1.0, norms, out=scales, where=norms > 0)
+    return csr_matrix(diags(scales).dot(matrix))
+
+
+def cosine_scores(queries: csr_matrix, documents: csr_matrix) -> np.ndarray:
+    """
+    Cosine similarity of M queries against N documents, as one sparse product
+    :param queries: M x V sparse matrix of unit rows, see `normalize_rows`
+    :param documents: N x V sparse matrix of unit rows
+    :return: M x N array of similarity ratios, an N array for one query
+    """
+    scores = queries.dot(documents.T).toarray()
+    return scores.ravel() if queries.shape[0] == 1 else scores
 
 
 def vectorize(*strs: str) -> np.array:
@@ -59,6 +295,15 @@ def vectorize(*strs: str) -> np.array:
     :param strs: string arguments
     :return: numpy array of strings
     """
+    return vectorize_sparse(*strs).toarray()
+
+
+def vectorize_sparse(*strs: str) -> csr_matrix:
+    """
+    N-gram counts of string arguments, one sparse row per string
+    :param strs: string arguments
+    :return: sparse matrix
+    """
     text: List[str] = [t for t in strs]
-    vectorizer = CountVectorizer(ngram_range=(2, 3))
-    return vectorizer.fit_transform(text).toarray()
+    vectorizer = CountVectorizer(ngram_range=NGRAM_RANGE)
+    return csr_matrix(vectorizer.fit_transform(text))
@@ -0,0 +1,333 @@
+"""
+Persistent (diskcache) stores, one per namespace, and caches in front of them:
+- corpus: versions stored by a former layout, never evicted
+- text: normalized texts of verses, chapters and queries
+- search: results of the searches
+- cloud: word clouds of the chapters and their rendered images
+"""
+import os
+import time
+
+from collections import OrderedDict
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Lock
+from typing import (
+    Any,
+    ContextManager,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    MutableMapping,
+    Optional,
+    Tuple,
+)
+from diskcache import Cache, Index  # type: ignore
+
+from ipybible import BIBLE_DATA_DIR, CLOUD_DATA_DIR, SEARCH_DATA_DIR, TEXT_DATA_DIR
+
+# Missing value, as None may be stored
+MISSING = object()
+MB = 2 ** 20
+DAY = 24 * 60 * 60
+
+
+def env_size_limit(name: str, default: int) -> int:
+    """Size limit in bytes, set in MB by e.g IPYBIBLE_TEXT_SIZE_LIMIT"""
+    return int(os.environ.get(f"IPYBIBLE_{name.upper()}_SIZE_LIMIT", default)) * MB
+
+
+@dataclass(frozen=True)
+class Namespace:
+    """Settings of a persistent store"""
+
+    name: str
+    directory: Path
+    size_limit: int
+    # One of diskcache's: least-recently-used, least-frequently-used, none...
+    eviction_policy: str
+    # Time to live, in seconds, of the entries derived from users' queries
+    query_ttl: Optional[float] = None
+
+    def open(self) -> Cache:
+        if self.name not in STORES:
+            STORES[self.name] = Cache(
+                str(self.directory),
+                size_limit=self.size_limit,
+                eviction_policy=self.eviction_policy,
+                statistics=True,
+            )
+        return STORES[self.name]
+
+
+CORPUS = Namespace(
+    name="corpus",
+    directory=BIBLE_DATA_DIR,
+    size_limit=env_size_limit("corpus", 1024),
+    eviction_policy="none",
+)
+TEXT = Namespace(
+    name="text",
+    directory=TEXT_DATA_DIR,
+    size_limit=env_size_limit("text", 512),
+    eviction_policy="least-recently-used",
+    query_ttl=30 * DAY,
+)
+SEARCH = Namespace(
+    name="search",
+    directory=SEARCH_DATA_DIR,
+    size_limit=env_size_limit("search", 256),
+    # The most searched queries are kept
+    eviction_policy="least-frequently-used",
+    query_ttl=7 * DAY,
+)
+CLOUD = Namespace(
+    name="cloud",
+    directory=CLOUD_DATA_DIR,
+    size_limit=env_size_limit("cloud", 512),
+    # The clouds of the chapters shown most recently are kept
+    eviction_policy="least-recently-used",
+)
+NAMESPACES = [CORPUS, TEXT, SEARCH, CLOUD]
+# Stores opened by this process, per namespace
+STORES: Dict[str, Cache] = {}
+
+
+def corpus_index() -> Index:
+    """Mapping of the corpus namespace, as the former BIBLE_INDEX"""
+    return Index.fromcache(CORPUS.open())
+
+
+def store_stats() -> Dict[str, Dict[str, Any]]:
+    """Number of entries, volume, hits and misses of every namespace"""
+    name_to_stats = {}
+    for namespace in NAMESPACES:
+        cache = namespace.open()
+        hits, misses = cache.stats()
+        name_to_stats[namespace.name] = dict(
+            count=len(cache),
+            volume=cache.volume(),
+            size_limit=namespace.size_limit,
+            eviction_policy=namespace.eviction_policy,
+            hits=hits,
+            misses=misses,
+        )
+    return name_to_stats
+
+
+def is_legacy_text_key(key: Hashable) -> bool:
+    """Sha256 key of a normalized text, stored in the corpus namespace before"""
+    return (
+        isinstance(key, str)
+        and len(key) == 64
+        and all(char in "0123456789abcdef" for char in key)
+    )
+
+
+def prune_stores() -> Dict[str, int]:
+    """
+    Remove the expired entries, then evict entries above the size limits.
+    Normalized texts stored in the corpus namespace by former versions are removed.
+    :return: namespace's name to the number of entries removed
+    """
+    name_to_removed = {}
+    for namespace in NAMESPACES:
+        cache = namespace.open()
+        name_to_removed[namespace.name] = cache.expire() + cache.cull()
+    corpus = CORPUS.open()
+    legacy_keys = [key for key in corpus.iterkeys() if is_legacy_text_key(key)]
+    for key in legacy_keys:
+        corpus.delete(key)
+    name_to_removed[CORPUS.name] += len(legacy_keys)
+    return name_to_removed
+
+
+@dataclass
+class LRUIndex(MutableMapping):
+    """
+    Bounded in-process LRU cache in front of a persistent index.
+    Reads are served from memory when possible, writes go through to the index.
+    Entries expiring from the index expire from memory at the same time.
+    An index evicting its least frequently used entries is read every time,
+    without memory, for its counts to include every hit.
+    The bulk get_many and set_many go straight to the index in one transaction,
+    without evicting the entries used most recently, e.g by searches.
+    """
+
+    index: MutableMapping
+    maxsize: int = 10000
+    hits: int = 0
+    misses: int = 0
+    # Key to its value and expire time, None if it does not expire
+    _memory: "OrderedDict[Hashable, Tuple[Any, Optional[float]]]" = field(
+        default_factory=OrderedDict, repr=False
+    )
+    _lock: Lock = field(default_factory=Lock, repr=False)
+
+    def __post_init__(self):
+        if getattr(self.index, "eviction_policy", None) == "least-frequently-used":
+            self.maxsize = 0
+
+    def _remember(
+        self, key: Hashable, value: Any, expire_time: Optional[float] = None
+    ) -> None:
+        with self._lock:
+            self._memory[key] = (value, expire_time)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.maxsize:
+                self._memory.popitem(last=False)
+
+    def _recall_locked(self, key: Hashable) -> Any:
+        value, expire_time = self._memory.get(key, (MISSING, None))
+        if value is not MISSING and expire_time is not None:
+            if expire_time <= time.time():
+                del self._memory[key]
+                value = MISSING
+        if value is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._memory.move_to_end(key)
+        return value
+
+    def _recall(self, key: Hashable) -> Any:
+        with self._lock:
+            return self._recall_locked(key)
+
+    def __getitem__(self, key: Hashable) -> Any:
+        value = self._recall(key)
+        if value is MISSING:
+            if isinstance(self.index, Cache):
+                value, expire_time = self.index.get(key, MISSING, expire_time=True)
+                if value is MISSING:
+                    raise KeyError(key)
+            else:
+                value, expire_time = self.index[key], None
+            self._remember(key, value, expire_time)
+        return value
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        # One read of the index, instead of `in` followed by `[]`
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key: object) -> bool:
+        with self._lock:
+            value, expire_time = self._memory.get(key, (MISSING, None))
+        if value is not MISSING and (expire_time is None or expire_time > time.time()):
+            return True
+        return key in self.index
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        self.index[key] = value
+        self._remember(key, value)
+
+    def set(self, key: Hashable, value: Any, expire: Optional[float] = None) -> None:
+        """
+        Set a value, expiring from the index after some time if supported
+        :param key: key
+        :param value: value
+        :param expire: seconds until the value expires, never by default
+        :return: None
+        """
+        if expire is not None and isinstance(self.index, Cache):
+            self.index.set(key, value, expire=expire)
+        else:
+            self.index[key] = value
+        self._remember(key, value, None if expire is None else time.time() + expire)
+
+    def __delitem__(self, key: Hashable) -> None:
+        with self._lock:
+            self._memory.pop(key, None)
+        del self.index[key]
+
+    def __iter__(self) -> Iterator:
+        return iter(self.index)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, Any]:
+        """
+        Values of the keys found, from memory or from the index
+        :param keys: keys to read
+        :return: key to value, for the keys found
+        """
+        found, missing = {}, []
+        with self._lock:
+            for key in keys:
+                value = self._recall_locked(key)
+                if value is MISSING:
+                    missing.append(key)
+                else:
+                    found[key] = value
+        found.update(get_many(self.index, missing))
+        return found
+
+    def set_many(self, items: Iterable[Tuple[Hashable, Any]]) -> None:
+        """
+        Write many values to the index, updating the ones already in memory
+        :param items: key, value pairs
+        :return: None
+        """
+        items = list(items)
+        set_many(self.index, items)
+        with self._lock:
+            for key, value in items:
+                if key in self._memory:
+                    self._memory[key] = (value, None)
+
+    def clear_memory(self) -> None:
+        with self._lock:
+            self._memory.clear()
+
+    def info(self) -> Dict[str, int]:
+        """Hits, misses, maximum and current size of the in-process cache"""
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            maxsize=self.maxsize,
+            currsize=len(self._memory),
+        )
+
+
+def get_many(index: MutableMapping, keys: Iterable[Hashable]) -> Dict[Hashable, Any]:
+    """
+    Values of the keys found in an index, read in one transaction if supported
+    :param index: mapping, e.g diskcache Index or LRUIndex
+    :param keys: keys to read
+    :return: key to value, for the keys found
+    """
+    if hasattr(index, "get_many"):
+        return index.get_many(keys)
+    found = {}
+    with transaction(index):
+        for key in keys:
+            value = index.get(key, MISSING)
+            if value is not MISSING:
+                found[key] = value
+    return found
+
+
+def set_many(index: MutableMapping, items: Iterable[Tuple[Hashable, Any]]) -> None:
+    """
+    Write many values to an index, in one transaction if supported
+    :param index: mapping, e.g diskcache Index or LRUIndex
+    :param items: key, value pairs
+    :return: None
+    """
+    if hasattr(index, "set_many"):
+        index.set_many(items)
+        return
+    with transaction(index):
+        for key, value in items:
+            index[key] = value
+
+
+def transaction(index: MutableMapping) -> ContextManager:
+    """Transaction of a diskcache Index or Cache, nothing for other mappings"""
+    return index.transact() if hasattr(index, "transact") else nullcontext()
@@ -72,6 +72,7 @@ setup(
     package_data={'ipybible': [
         'data/bible/',
         'data/bible/**/**/**',
+        'data/bible/*.corpus',
         'data/img/*.png'
     ]},
     setup_requires=setup_requirements,
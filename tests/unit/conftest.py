@@ -0,0 +1,104 @@
+import json
+import pytest
+import spacy  # type: ignore
+
+from spacy.language import Language  # type: ignore
+
+from ipybible import bible
+from ipybible.bible import Bible
+from ipybible.similarity import SpacyModels
+from ipybible.store import LRUIndex
+
+# Per-book JSON files, as retrieved from the API
+BOOKS = {
+    "genesis": {
+        "1": {
+            "chapter": {
+                "1": {
+                    "verse": "In the beginning God created the heaven and the earth."
+                },
+                "2": {"verse": "And the earth was without form, and void."},
+                "3": {
+                    "verse": "And God said, Let there be light: and there was light."
+                },
+            }
+        },
+        "2": {
+            "chapter": {
+                "1": {"verse": "Thus the heavens and the earth were finished."},
+                "2": {"verse": "And on the seventh day God ended his work."},
+            }
+        },
+    },
+    "psalms": {
+        "1": {
+            "chapter": {
+                "1": {"verse": "Blessed is the man that walketh not in the counsel."},
+                "2": {"verse": "But his delight is in the law of the LORD."},
+            }
+        },
+        "2": {
+            "chapter": {
+                "1": {"verse": "Why do the heathen rage, and the people imagine?"},
+            }
+        },
+    },
+}
+
+
+@Language.component("lower_lemma")
+def lower_lemma(doc):
+    for token in doc:
+        token.lemma_ = token.lower_
+    return doc
+
+
+def load_model(name, disable):
+    nlp = spacy.blank(name[:2])
+    nlp.add_pipe("lower_lemma")
+    return nlp
+
+
+@pytest.fixture
+def spacy_load(monkeypatch):
+    """Blank spacy models instead of the installed ones, lemmas being the words"""
+    monkeypatch.setattr(spacy, "load", load_model)
+
+
+@pytest.fixture
+def text_index(monkeypatch, spacy_load):
+    text_index = {}
+    monkeypatch.setattr(bible, "TEXT_INDEX", text_index)
+    monkeypatch.setattr(
+        bible,
+        "LANGUAGE_TO_MODEL",
+        SpacyModels({"EN": "en_core_web_sm"}),
+    )
+    yield text_index
+
+
+@pytest.fixture
+def books_dir(tmp_path):
+    books_dir = tmp_path / "books"
+    books_dir.mkdir()
+    for book, chapter_to_verse in BOOKS.items():
+        (books_dir / f"{book}.json").write_text(json.dumps(chapter_to_verse))
+    yield books_dir
+
+
+@pytest.fixture
+def bible_data_dir(monkeypatch, tmp_path, text_index):
+    """Versions stored in a temporary directory, their searches cached in memory"""
+    bible_data_dir = tmp_path / "bible"
+    bible_data_dir.mkdir()
+    monkeypatch.setattr(bible, "BIBLE_DATA_DIR", bible_data_dir)
+    monkeypatch.setattr(bible, "CORPORA", {})
+    monkeypatch.setattr(bible, "NGRAM_INDEXES", {})
+    monkeypatch.setattr(bible, "VERSE_INDEXES", {})
+    monkeypatch.setattr(bible, "SEARCH_INDEX", LRUIndex({}))
+    yield bible_data_dir
+
+
+@pytest.fixture
+def imported_bible(bible_data_dir, books_dir):
+    yield Bible.from_files("test", "EN", books_dir)
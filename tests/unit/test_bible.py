@@ -0,0 +1,256 @@
+import pytest
+import zipfile
+
+from dataclasses import replace
+
+from ipybible import bible
+from ipybible.bible import (
+    Bible,
+    Book,
+    Hit,
+    Verse,
+    cached_search,
+    clean_text_key,
+    merge_hits,
+    search_key,
+    search_versions,
+    shared_search_executor,
+    shutdown_shared_executor,
+)
+from ipybible import corpus as corpus_module
+from ipybible.corpus import (
+    Corpus,
+    CorpusFormatError,
+    read_corpus_file,
+    write_corpus_file,
+)
+from ipybible.similarity import SpacyModels
+from ipybible.store import LRUIndex
+
+
+@pytest.fixture
+def book():
+    book = Book(name="genesis", language="EN", version="test")
+    chapter = book.chapter(1)
+    chapter.add_verse(Verse(1, "In the beginning God created the heaven", "EN"))
+    chapter.add_verse(Verse(2, "And the earth was without form", "EN"))
+    yield book
+
+
+def test_chapter_text_cached(book):
+    chapter = book.chapter(1)
+    assert chapter.text is chapter.text
+    chapter.add_verse(Verse(3, "and darkness", "EN"))
+    assert chapter.text.endswith("without form and darkness")
+
+
+def test_chapter_clean_text_key(text_index, book):
+    chapter = book.chapter(1)
+    assert chapter.clean_text() == text_index[clean_text_key("test", "genesis", 1)]
+    chapter.add_verse(Verse(3, "and darkness", "EN"))
+    assert clean_text_key("test", "genesis", 1) not in text_index
+    assert chapter.clean_text().endswith("darkness")
+
+
+class PopCounter(dict):
+    pops = 0
+
+    def pop(self, *args):
+        self.pops += 1
+        return super().pop(*args)
+
+
+def test_chapter_persisted_clean_text_invalidated(text_index, monkeypatch):
+    text_index = PopCounter(text_index)
+    monkeypatch.setattr(bible, "TEXT_INDEX", text_index)
+    # Stored by a former process, not read by this chapter yet
+    text_index[clean_text_key("test", "genesis", 1)] = "former clean text"
+    chapter = Book(name="genesis", language="EN", version="test").chapter(1)
+    chapter.add_verse(Verse(1, "In the beginning God created the heaven", "EN"))
+    chapter.add_verse(Verse(2, "and darkness", "EN"))
+    # Dropped once, not for every verse added
+    assert text_index.pops == 1
+    assert clean_text_key("test", "genesis", 1) not in text_index
+    assert chapter.clean_text().endswith("darkness")
+    chapter.add_verse(Verse(3, "And God said", "EN"))
+    assert text_index.pops == 2
+    assert chapter.clean_text().endswith("god said")
+
+
+def test_book_text_invalidated(text_index, book):
+    assert book.text == book.chapter(1).text
+    clean_text = book.clean_text()
+    book.chapter(2).add_verse(Verse(1, "Thus the heavens were finished", "EN"))
+    assert book.text.endswith("Thus the heavens were finished")
+    assert book.clean_text() != clean_text
+
+
+def test_book_top_terms(text_index, book):
+    book.chapter(2).add_verse(Verse(1, "God saw the earth, the earth was good", "EN"))
+    assert book.chapter(2).lemma_counts(k=2) == {"earth": 2, "god": 1}
+    assert book.top_terms(k=2) == [("earth", 3), ("god", 2)]
+    assert book.top_terms(k=1, chapter_numbers=range(2, 3)) == [("earth", 2)]
+
+
+def test_cached_search(monkeypatch):
+    search_index = {}
+    monkeypatch.setattr(bible, "SEARCH_INDEX", LRUIndex(search_index))
+    computed = []
+
+    def compute():
+        computed.append(True)
+        return {"genesis": 1.0}
+
+    key = search_key("book_to_similarity", "kjv", "EN", "god create")
+    assert key[:2] == ("book_to_similarity", bible.SCORING_VERSION)
+    assert cached_search(key, compute) == cached_search(key, compute)
+    assert computed == [True]
+    assert search_index[key] == {"genesis": 1.0}
+
+
+def test_merge_hits():
+    version_to_hits = {
+        "kjv": [Hit("genesis", 0.9, version="kjv"), Hit("exodus", 0.2, version="kjv")],
+        "asv": [Hit("genesis", 0.5, version="asv")],
+    }
+    assert [(hit.version, hit.score) for hit in merge_hits(version_to_hits)] == [
+        ("kjv", 0.9),
+        ("asv", 0.5),
+        ("kjv", 0.2),
+    ]
+
+
+def test_verse_to_similarity(imported_bible):
+    verse_to_similarity = imported_bible.verse_to_similarity(
+        "God created the heaven", "genesis", 1
+    )
+    assert list(verse_to_similarity) == [1]
+    assert not imported_bible.verse_to_similarity("God created", "genesis", 2)
+    with pytest.raises(ValueError):
+        imported_bible.verse_to_similarity("God created", "genesis", 3)
+    with pytest.raises(ValueError):
+        imported_bible.verse_to_similarity("God created", "exodus", 1)
+
+
+def test_book_to_similarity_many_executor(imported_bible):
+    texts = ["God created the heaven", "the heathen rage", "God created the heaven"]
+    with imported_bible:
+        results = imported_bible.book_to_similarity_many(texts, workers=2)
+        executor = imported_bible._executor
+    # Shut down when leaving the bible's context
+    assert imported_bible._executor is None
+    with pytest.raises(RuntimeError):
+        executor.submit(len, ())
+    assert results == imported_bible.book_to_similarity_many(texts, workers=1)
+    assert list(results[0])[0] == "genesis"
+    assert list(results[1])[0] == "psalms"
+
+
+def test_search_executor_workers(imported_bible):
+    with imported_bible:
+        executor = imported_bible.search_executor(workers=1)
+        assert imported_bible.search_executor() is executor
+        assert imported_bible.search_executor(workers=1) is executor
+        # Restarted for another number of workers
+        resized = imported_bible.search_executor(workers=2)
+        assert resized is not executor
+        with pytest.raises(RuntimeError):
+            executor.submit(len, ())
+        assert resized.submit(len, ()).result() == 0
+
+
+def test_import_books(bible_data_dir, books_dir):
+    archive = books_dir.parent / "books.zip"
+    with zipfile.ZipFile(archive, "w") as books_zip:
+        for book_file in books_dir.iterdir():
+            books_zip.write(book_file, f"test/{book_file.name}")
+    for version, path in [("test", books_dir), ("zipped", archive)]:
+        imported = Bible.from_files(version, "EN", path)
+        assert [book.name for book in imported.books] == ["genesis", "psalms"]
+        genesis = imported.book("genesis")
+        assert [chapter.number for chapter in genesis.chapters] == [1, 2]
+        assert [verse.number for verse in genesis.chapter(1).verses] == [1, 2, 3]
+        assert genesis.chapter(2).verse(2).text == (
+            "And on the seventh day God ended his work."
+        )
+        corpus = Corpus.from_sections(*read_corpus_file(bible.corpus_path(version)))
+        assert corpus.book_names == ["genesis", "psalms"]
+        assert corpus.chapter_keys() == [
+            ("genesis", 1),
+            ("genesis", 2),
+            ("psalms", 1),
+            ("psalms", 2),
+        ]
+        assert corpus.chapter_clean_text(0) == genesis.chapter(1).clean_text()
+    assert sorted(path.name for path in bible_data_dir.glob("*.corpus")) == [
+        "test.corpus",
+        "zipped.corpus",
+    ]
+
+
+@pytest.mark.parametrize("level", ["book", "verse"])
+def test_search_versions(imported_bible, books_dir, monkeypatch, level):
+    monkeypatch.setattr(bible, "SHARED_EXECUTOR", None)
+    monkeypatch.setattr(bible, "SHARED_EXECUTOR_WORKERS", 0)
+    monkeypatch.setattr(
+        bible,
+        "LANGUAGE_TO_MODEL",
+        SpacyModels({"EN": "en_core_web_sm", "NL": "nl_core_news_sm"}),
+    )
+    bibles = [
+        imported_bible,
+        Bible.from_files("other", "EN", books_dir),
+        Bible.from_files("dutch", "NL", books_dir),
+    ]
+    prepare_query = bible.prepare_query
+    normalized = []
+
+    def record_prepare_query(query, language):
+        if isinstance(query, str):
+            normalized.append(language)
+        return prepare_query(query, language)
+
+    monkeypatch.setattr(bible, "prepare_query", record_prepare_query)
+    text = "God created the heaven"
+    # Searched by the workers first, before the results are cached in this process
+    version_to_hits = search_versions(text, bibles, k=2, level=level, workers=2)
+    executor = bible.SHARED_EXECUTOR
+    shutdown_shared_executor()
+    with pytest.raises(RuntimeError):
+        executor.submit(len, ())
+    assert normalized == ["EN", "NL"]
+    assert search_versions(text, bibles, k=2, level=level, workers=1) == version_to_hits
+    for version_bible in bibles:
+        assert version_to_hits[version_bible.version] == [
+            replace(hit, version=version_bible.version)
+            for hit in version_bible.search(text, k=2, level=level)
+        ]
+    assert version_to_hits["test"][0].book == "genesis"
+
+
+def test_corpus_format_rejected(imported_bible, monkeypatch):
+    with monkeypatch.context() as patch:
+        patch.setattr(corpus_module, "FILE_FORMAT", corpus_module.FILE_FORMAT + 1)
+        write_corpus_file(
+            bible.corpus_path("test"), *imported_bible._corpus.to_sections()
+        )
+    monkeypatch.setattr(bible, "CORPORA", {})
+    # Not downloaded, an imported version has no source to download from
+    with pytest.raises(CorpusFormatError, match="Bible.from_files"):
+        Bible(version="test", language="EN")
+
+
+def test_shared_search_executor_workers(monkeypatch):
+    monkeypatch.setattr(bible, "SHARED_EXECUTOR", None)
+    monkeypatch.setattr(bible, "SHARED_EXECUTOR_WORKERS", 0)
+    executor = shared_search_executor(workers=1)
+    try:
+        assert shared_search_executor() is executor
+        # Restarted for another number of workers
+        resized = shared_search_executor(workers=2)
+        assert resized is not executor
+        with pytest.raises(RuntimeError):
+            executor.submit(len, ())
+        assert resized.submit(len, ()).result() == 0
+    finally:
+        shutdown_shared_executor()
@@ -0,0 +1,162 @@
+import click
+import json
+import pytest
+
+from click.testing import CliRunner
+
+from ipybible import store
+from ipybible.bible import Bible
+from ipybible.cli import main, parse_chapters, parse_version
+from ipybible.similarity import text_key
+from ipybible.store import Namespace
+
+QUERIES = "God created the heaven\nthe heathen rage\n"
+
+
+@pytest.fixture
+def runner():
+    yield CliRunner()
+
+
+@pytest.fixture
+def cloud_index(monkeypatch):
+    pytest.importorskip("wordcloud")
+    from ipybible import bible_cloud
+
+    cloud_index = {}
+    monkeypatch.setattr(bible_cloud, "CLOUD_INDEX", cloud_index)
+    yield cloud_index
+
+
+def test_parse_version():
+    assert parse_version("kjv", "en") == ("kjv", "EN")
+    assert parse_version("statenvertaling:nl", "EN") == ("statenvertaling", "NL")
+
+
+def test_parse_chapters():
+    assert parse_chapters("3") == range(3, 4)
+    assert parse_chapters("1-5") == range(1, 6)
+    with pytest.raises(click.BadParameter):
+        parse_chapters("first")
+
+
+def test_preload(runner, imported_bible):
+    result = runner.invoke(main, ["preload", "test", "--workers", "1"])
+    assert result.exit_code == 0
+    assert result.output == "Preloaded 2 books of test\n"
+
+
+def test_search(runner, imported_bible):
+    result = runner.invoke(
+        main, ["search", "God created the heaven", "--version", "test"]
+    )
+    assert result.exit_code == 0
+    [search] = json.loads(result.output)
+    assert search["query"] == "God created the heaven"
+    assert search["scoring"] == "cosine"
+    assert list(search["book_to_similarity"]) == ["genesis"]
+    assert list(search["chapter_to_similarity"]["genesis"]) == ["1", "2"]
+
+
+def test_search_queries(runner, imported_bible, tmp_path):
+    queries = tmp_path / "queries.txt"
+    queries.write_text(QUERIES)
+    result = runner.invoke(
+        main,
+        ["search", "--queries", str(queries), "--version", "test", "--book", "psalms"],
+    )
+    assert result.exit_code == 0
+    searches = json.loads(result.output)
+    assert [search["query"] for search in searches] == QUERIES.splitlines()
+    assert list(searches[1]["chapter_to_similarity"]) == ["psalms"]
+
+
+def test_search_scoring(runner, imported_bible):
+    result = runner.invoke(
+        main, ["search", "the heathen", "--version", "test", "--scoring", "bm25"]
+    )
+    assert result.exit_code == 0
+    assert json.loads(result.output)[0]["scoring"] == "bm25"
+    result = runner.invoke(
+        main, ["search", "the heathen", "--version", "test", "--scoring", "jaccard"]
+    )
+    assert result.exit_code == 2
+    assert "--scoring" in result.output
+
+
+def test_compare(runner, imported_bible, books_dir):
+    Bible.from_files("other", "EN", books_dir)
+    result = runner.invoke(
+        main,
+        ["compare", "God created the heaven", "test", "other:en", "--level", "verse"],
+    )
+    assert result.exit_code == 0
+    compared = json.loads(result.output)
+    assert list(compared["version_to_hits"]) == ["test", "other"]
+    hit = compared["version_to_hits"]["test"][0]
+    assert (hit["book"], hit["chapter"], hit["verse"]) == ("genesis", 1, 1)
+    assert sorted(hit["version"] for hit in compared["hits"][:2]) == ["other", "test"]
+
+
+def test_warm_cache(runner, imported_bible, cloud_index, tmp_path):
+    queries = tmp_path / "queries.txt"
+    queries.write_text(QUERIES)
+    result = runner.invoke(main, ["warm-cache", str(queries), "--version", "test"])
+    assert result.exit_code == 0
+    # The first chapter, the most similar chapters of genesis and psalms
+    assert result.output == "Warmed 2 queries and 2 clouds\n"
+    assert len(cloud_index) == 2
+
+
+def test_pregenerate_clouds(runner, imported_bible, cloud_index):
+    args = ["pregenerate-clouds", "test", "--workers", "1"]
+    assert runner.invoke(main, args).output == "Rendered 4 of 4 clouds of test\n"
+    assert runner.invoke(main, args).output == "Rendered 0 of 4 clouds of test\n"
+
+
+def test_top_terms(runner, imported_bible):
+    result = runner.invoke(
+        main, ["top-terms", "genesis", "--version", "test", "--chapters", "1-2"]
+    )
+    assert result.exit_code == 0
+    assert result.output.splitlines()[0] == "god\t3"
+    result = runner.invoke(
+        main, ["top-terms", "genesis", "--version", "test", "--chapters", "first"]
+    )
+    assert result.exit_code == 2
+    assert "--chapters" in result.output
+    result = runner.invoke(main, ["top-terms", "exodus", "--version", "test"])
+    assert result.exit_code == 2
+    assert "exodus not in test" in result.output
+
+
+@pytest.fixture
+def corpus_store(monkeypatch, tmp_path):
+    corpus = Namespace(
+        name="corpus",
+        directory=tmp_path / "corpus",
+        size_limit=2 ** 20,
+        eviction_policy="none",
+    )
+    monkeypatch.setattr(store, "STORES", {})
+    monkeypatch.setattr(store, "CORPUS", corpus)
+    monkeypatch.setattr(store, "NAMESPACES", [corpus])
+    yield corpus.open()
+
+
+def test_cache_stats(runner, corpus_store):
+    corpus_store["kjv"] = {}
+    result = runner.invoke(main, ["cache-stats"])
+    assert result.exit_code == 0
+    assert result.output.startswith("corpus: 1 entries, ")
+    assert result.output.rstrip().endswith("none, hit ratio -")
+
+
+def test_cache_prune(runner, corpus_store):
+    corpus_store["kjv"] = {}
+    corpus_store[text_key("In the beginning")] = "beginning"
+    result = runner.invoke(main, ["cache-prune"])
+    assert result.exit_code == 0
+    # Normalized text stored in the corpus namespace by a former version
+    assert result.output == "corpus: 1 entries removed\n"
+    assert list(corpus_store) == ["kjv"]
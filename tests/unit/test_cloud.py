@@ -0,0 +1,43 @@
+import io
+import pytest
+
+pytest.importorskip("wordcloud")
+
+from PIL import Image  # type: ignore  # noqa: E402
+
+from ipybible import bible_cloud  # noqa: E402
+from ipybible.bible_cloud import (  # noqa: E402
+    LOVE_MASK_IMG,
+    cloud_image,
+    cloud_image_key,
+    load_mask,
+    pregenerate_clouds,
+)
+
+
+@pytest.fixture
+def cloud_index(monkeypatch):
+    cloud_index = {}
+    monkeypatch.setattr(bible_cloud, "CLOUD_INDEX", cloud_index)
+    yield cloud_index
+
+
+def test_cloud_image_cached(cloud_index):
+    frequencies = {"god": 2, "create": 1, "heaven": 1}
+    image = cloud_image(frequencies, width=100)
+    assert Image.open(io.BytesIO(image)).width <= 100
+    assert cloud_index[cloud_image_key(frequencies, LOVE_MASK_IMG, 100, "png")] == image
+    # The word cloud, holding its mask, is not stored
+    assert len(cloud_index) == 1
+    assert cloud_image(dict(reversed(frequencies.items())), width=100) == image
+
+
+def test_pregenerate_clouds(cloud_index):
+    frequency_tables = [{"god": 2, "heaven": 1}, {"earth": 1, "form": 1}]
+    assert pregenerate_clouds(frequency_tables * 2, width=100) == 2
+    assert pregenerate_clouds(frequency_tables, width=100) == 0
+    assert len(cloud_index) == 2
+
+
+def test_mask_loaded_once():
+    assert load_mask(LOVE_MASK_IMG) is load_mask(LOVE_MASK_IMG)
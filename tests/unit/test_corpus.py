@@ -0,0 +1,80 @@
+import pytest
+
+from ipybible import corpus as corpus_module
+from ipybible.corpus import (
+    Corpus,
+    CorpusFormatError,
+    read_corpus_file,
+    write_corpus_file,
+)
+
+VERSES = [
+    ("genesis", 1, 1, "In the beginning God created the heaven and the earth."),
+    ("genesis", 1, 2, "And the earth was without form, and void; "),
+    ("genesis", 2, 1, "Thus the heavens and the earth were finished."),
+    ("psalms", 1, 1, "Blessed is the man that walketh not in the counsel."),
+    ("psalms", 1, 2, "But his delight is in the law of the LORD."),
+]
+
+
+@pytest.fixture
+def corpus():
+    yield Corpus.build(language="EN", rows=VERSES)
+
+
+def test_corpus_books(corpus):
+    assert corpus.book_names == ["genesis", "psalms"]
+    assert [corpus.chapter_numbers[row] for row in corpus.chapter_rows(0)] == [1, 2]
+    assert [corpus.chapter_numbers[row] for row in corpus.chapter_rows(1)] == [1]
+
+
+def test_corpus_verses(corpus):
+    verse_rows = corpus.verse_rows(0)
+    assert [corpus.verse_numbers[row] for row in verse_rows] == [1, 2]
+    assert corpus.verse_text(verse_rows[1]) == VERSES[1][3].strip()
+
+
+def test_corpus_texts(corpus):
+    genesis_1 = " ".join(text.strip() for _, _, _, text in VERSES[:2])
+    assert corpus.chapter_text(0) == genesis_1
+    assert corpus.book_text(0) == " ".join([genesis_1, VERSES[2][3]])
+    assert corpus.book_text(1) == " ".join(text for _, _, _, text in VERSES[3:])
+
+
+def test_corpus_clean_text(corpus):
+    corpus.add_clean_text(["beginning god create", "", "heaven finish", "", "law"])
+    assert corpus.chapter_clean_text(0) == "beginning god create"
+    assert corpus.book_clean_text(0) == "beginning god create heaven finish"
+    assert corpus.book_clean_text(1) == "law"
+    assert corpus.verse_clean_text(1) == ""
+
+
+def test_corpus_file(corpus, tmp_path):
+    corpus.add_clean_text(["beginning god create", "", "heaven finish", "", "law"])
+    header, sections = corpus.to_sections()
+    write_corpus_file(tmp_path / "test.corpus", header, sections)
+    mapped = Corpus.from_sections(*read_corpus_file(tmp_path / "test.corpus"))
+    assert mapped.book_names == corpus.book_names
+    assert mapped.chapter_keys() == corpus.chapter_keys()
+    assert mapped.book_text(1) == corpus.book_text(1)
+    assert mapped.chapter_clean_text(1) == corpus.chapter_clean_text(1)
+
+
+def test_corpus_lemma_counts(corpus, tmp_path):
+    corpus.add_clean_text(["god create god", "", "heaven god", "", "law"])
+    assert corpus.chapter_lemma_counts(0) == {"god": 2, "create": 1}
+    assert corpus.book_lemma_counts(0) == {"god": 3, "create": 1, "heaven": 1}
+    assert corpus.book_lemma_counts(0, k=1) == {"god": 3}
+    write_corpus_file(tmp_path / "test.corpus", *corpus.to_sections())
+    mapped = Corpus.from_sections(*read_corpus_file(tmp_path / "test.corpus"))
+    assert mapped.has_lemma_counts
+    assert mapped.book_lemma_counts(1) == {"law": 1}
+    assert mapped.chapter_lemma_counts(1) == corpus.chapter_lemma_counts(1)
+
+
+def test_corpus_file_format(corpus, tmp_path, monkeypatch):
+    with monkeypatch.context() as patch:
+        patch.setattr(corpus_module, "FILE_FORMAT", corpus_module.FILE_FORMAT - 1)
+        write_corpus_file(tmp_path / "test.corpus", *corpus.to_sections())
+    with pytest.raises(CorpusFormatError):
+        read_corpus_file(tmp_path / "test.corpus")
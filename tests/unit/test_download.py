@@ -0,0 +1,95 @@
+import json
+import threading
+import pytest
+import zipfile
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from ipybible.download import BibleNotFound, BookDownloader, read_books
+
+BOOK = {"1": {"chapter": {"1": {"verse": "In the beginning"}}}}
+
+
+class BibleHandler(BaseHTTPRequestHandler):
+    """Stand-in for the bible API, the first request of a book fails once"""
+
+    requests = []
+
+    def do_GET(self):
+        params = parse_qs(urlparse(self.path).query)
+        book, version = params["p"][0], params["version"][0]
+        BibleHandler.requests.append(book)
+        if BibleHandler.requests.count(book) == 1 and book == "ruth":
+            self.send_response(503)
+            self.end_headers()
+            return
+        body = "NULL" if version == "unknown" else json.dumps({"book": BOOK})
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(f"({body});".encode("utf-8"))
+
+    def log_message(self, *_):
+        pass
+
+
+@pytest.fixture
+def downloader():
+    BibleHandler.requests = []
+    server = HTTPServer(("127.0.0.1", 0), BibleHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield BookDownloader(
+        base_url=f"http://127.0.0.1:{server.server_port}/json", backoff_factor=0
+    )
+    server.shutdown()
+    server.server_close()
+
+
+def test_download_books(downloader):
+    store = {}
+    downloader.download(["genesis", "ruth", "psalms"], store, version="kjv")
+    assert store == {"genesis": BOOK, "ruth": BOOK, "psalms": BOOK}
+    # Retried once
+    assert BibleHandler.requests.count("ruth") == 2
+
+
+def test_download_resume(downloader):
+    store = {"genesis": BOOK}
+    downloader.download(["genesis", "psalms"], store, version="kjv")
+    assert BibleHandler.requests == ["psalms"]
+    assert set(store) == {"genesis", "psalms"}
+
+
+def test_retrieve_closes_session(downloader, monkeypatch):
+    closed = []
+    new_session = downloader.session
+
+    def session():
+        session = new_session()
+        session.close = lambda: closed.append(session)
+        return session
+
+    monkeypatch.setattr(downloader, "session", session)
+    assert downloader.retrieve("genesis", version="kjv") == BOOK
+    assert len(closed) == 1
+
+
+def test_download_unknown(downloader):
+    with pytest.raises(BibleNotFound):
+        downloader.download(["genesis"], {}, version="unknown")
+
+
+def test_read_books(tmp_path):
+    for book in ["psalms", "genesis"]:
+        with open(tmp_path / f"{book}.json", "w") as out_json:
+            json.dump(BOOK, out_json)
+    assert list(read_books(tmp_path)) == [("genesis", BOOK), ("psalms", BOOK)]
+
+
+def test_read_books_archive(tmp_path):
+    archive_path = tmp_path / "kjv.zip"
+    with zipfile.ZipFile(archive_path, "w") as archive:
+        archive.writestr("kjv/psalms.json", json.dumps({"book": BOOK}))
+        archive.writestr("kjv/genesis.json", json.dumps(BOOK))
+    assert list(read_books(archive_path)) == [("genesis", BOOK), ("psalms", BOOK)]
@@ -0,0 +1,162 @@
+import pytest
+
+from sklearn.feature_extraction.text import CountVectorizer  # type: ignore
+
+from ipybible.corpus import read_corpus_file, write_corpus_file
+from ipybible.index import NgramIndex, VerseIndex, decode_varints, encode_varints
+from ipybible.scoring import scorer_class
+from ipybible.similarity import NGRAM_RANGE, Query, cosine_sim
+
+CHAPTERS = [
+    ("genesis", 1, "beginning god create heaven earth earth form void"),
+    ("genesis", 2, "heaven earth finish host god end work god make"),
+    ("psalms", 1, "bless man walk counsel ungodly stand way sinner"),
+    ("psalms", 2, "heathen rage people imagine vain thing"),
+]
+VERSES = [
+    "beginning god create heaven earth",
+    "earth form void",
+    "heaven earth finish host",
+    "god end work god make",
+    "bless man walk counsel ungodly",
+    "stand way sinner",
+    "heathen rage people imagine vain thing",
+]
+
+
+@pytest.fixture
+def ngram_index():
+    rows = [(book, chapter) for book, chapter, _ in CHAPTERS]
+    texts = [text for _, _, text in CHAPTERS]
+    yield NgramIndex.build(rows, texts)
+
+
+@pytest.mark.parametrize(
+    "query", ["god create heaven earth", "heaven earth finish", "walk counsel man"]
+)
+def test_scores_match_cosine_sim(ngram_index, query):
+    scores = ngram_index.scores(Query(text=query, clean_text=query))
+    for score, (_, _, text) in zip(scores, CHAPTERS):
+        assert score == pytest.approx(cosine_sim(query, text))
+
+
+def test_scores_many(ngram_index):
+    queries = [
+        Query(text=text, clean_text=text)
+        for text in ["god create heaven earth", "unknown words only", "vain thing"]
+    ]
+    scores = ngram_index.scores_many(queries)
+    assert scores.shape == (3, len(CHAPTERS))
+    for query, query_scores in zip(queries, scores):
+        assert list(query_scores) == list(ngram_index.scores(query))
+
+
+@pytest.mark.parametrize("scoring", ["cosine", "tfidf", "bm25"])
+def test_scores_rows(ngram_index, scoring):
+    query = Query(text="heaven earth god", clean_text="heaven earth god")
+    rows = ngram_index.book_rows("psalms")
+    scores = ngram_index.scores(query, scoring=scoring)
+    assert list(ngram_index.scores(query, scoring=scoring, rows=rows)) == list(
+        scores[rows]
+    )
+
+
+def test_scores_unknown_query(ngram_index):
+    query = Query(text="unknown words only", clean_text="unknown words only")
+    assert not ngram_index.scores(query).any()
+
+
+def test_book_rows(ngram_index):
+    assert ngram_index.rows[ngram_index.book_rows("psalms")] == [
+        ("psalms", 1),
+        ("psalms", 2),
+    ]
+    assert ngram_index.rows[ngram_index.book_rows("exodus")] == []
+
+
+def test_index_file(ngram_index, tmp_path):
+    header, sections = ngram_index.to_sections()
+    write_corpus_file(tmp_path / "test.corpus", header, sections)
+    header, sections = read_corpus_file(tmp_path / "test.corpus")
+    mapped_index = NgramIndex.from_sections(header, sections, rows=ngram_index.rows)
+    assert dict(mapped_index.vocabulary) == ngram_index.vocabulary
+    query = Query(text="heaven earth finish", clean_text="heaven earth finish")
+    assert list(mapped_index.scores(query)) == list(ngram_index.scores(query))
+    assert mapped_index.build_id == ngram_index.build_id
+    assert (mapped_index.postings != ngram_index.postings).nnz == 0
+
+
+@pytest.mark.parametrize("k", [1, 2, 4])
+def test_top_rows(ngram_index, k):
+    query = Query(text="heaven earth god", clean_text="heaven earth god")
+    scores = ngram_index.scores(query)
+    rows, top_scores = ngram_index.top_rows(query, k)
+    expected = sorted((score for score in scores if score > 0), reverse=True)[:k]
+    assert list(top_scores) == pytest.approx(expected)
+    assert list(scores[rows]) == list(top_scores)
+
+
+def test_top_books(ngram_index):
+    query = Query(text="heaven earth god", clean_text="heaven earth god")
+    books, scores = ngram_index.top_rows(query, 2, groups=ngram_index.row_books)
+    assert [ngram_index.book_names[book] for book in books] == ["genesis"]
+    assert scores[0] == ngram_index.book_scores(ngram_index.scores(query))[0]
+
+
+def test_varints():
+    values = [0, 1, 127, 128, 300, 16384, 2 ** 40]
+    encoded = encode_varints(values)
+    assert len(encoded) == 1 + 1 + 1 + 2 + 2 + 3 + 6
+    assert list(decode_varints(encoded)) == values
+
+
+@pytest.mark.parametrize("query", ["god create heaven earth", "earth god", "vain"])
+def test_verse_scores_match_cosine_sim(ngram_index, tmp_path, query):
+    verse_index = VerseIndex.build(ngram_index.vocabulary, VERSES)
+    write_corpus_file(tmp_path / "test.corpus", *verse_index.to_sections())
+    _, sections = read_corpus_file(tmp_path / "test.corpus")
+    verse_index = VerseIndex.from_sections(sections, ngram_index.vocabulary)
+    rows, scores = verse_index.scores(Query(text=query, clean_text=query))
+    expected = {
+        row: cosine_sim(query, text)
+        for row, text in enumerate(VERSES)
+        if cosine_sim(query, text) > 0
+    }
+    assert list(rows) == list(expected)
+    assert list(scores) == pytest.approx(list(expected.values()))
+    top_rows, _ = verse_index.top_verses(Query(text=query, clean_text=query), 2)
+    assert list(top_rows) == sorted(expected, key=lambda row: -expected[row])[:2]
+
+
+@pytest.mark.parametrize("scoring", ["cosine", "tfidf", "bm25"])
+def test_verse_scores_rows(ngram_index, scoring):
+    verse_index = VerseIndex.build(ngram_index.vocabulary, VERSES)
+    query = Query(text="heaven earth god", clean_text="heaven earth god")
+    rows, scores = verse_index.scores(query, scoring=scoring)
+    chapter_rows, chapter_scores = verse_index.scores(
+        query, scoring=scoring, rows=slice(2, 4)
+    )
+    in_chapter = (rows >= 2) & (rows < 4)
+    assert list(chapter_rows) == list(rows[in_chapter]) == [2]
+    assert list(chapter_scores) == list(scores[in_chapter])
+
+
+@pytest.mark.parametrize("scoring", ["tfidf", "bm25"])
+def test_scorings(ngram_index, scoring):
+    query = Query(text="god create heaven earth", clean_text="god create heaven earth")
+    scores = ngram_index.scores(query, scoring=scoring)
+    rows, top_scores = ngram_index.top_rows(query, 2, scoring=scoring)
+    assert list(top_scores) == sorted(scores, reverse=True)[:2]
+    assert list(scores[rows]) == list(top_scores)
+    # Verses are scored with the statistics of the verses
+    verse_index = VerseIndex.build(ngram_index.vocabulary, VERSES)
+    counts = CountVectorizer(
+        ngram_range=NGRAM_RANGE, vocabulary=ngram_index.vocabulary
+    ).transform(VERSES)
+    query_counts = CountVectorizer(
+        ngram_range=NGRAM_RANGE, vocabulary=ngram_index.vocabulary
+    ).transform([query.clean_text])
+    expected = scorer_class(scoring)(counts).scores_many(query_counts)[0]
+    verse_rows, verse_scores = verse_index.scores(query, scoring=scoring)
+    assert list(verse_rows) == list(expected.nonzero()[0])
+    assert list(verse_scores) == pytest.approx(list(expected[verse_rows]))
@@ -0,0 +1,70 @@
+import pytest
+
+from sklearn.feature_extraction.text import TfidfVectorizer  # type: ignore
+from sklearn.metrics.pairwise import cosine_similarity  # type: ignore
+
+from ipybible.scoring import (
+    BM25Scorer,
+    CosineScorer,
+    SCORERS,
+    SCORINGS,
+    Scorer,
+    TfidfScorer,
+    score_texts,
+    scorer_class,
+)
+from ipybible.similarity import NGRAM_RANGE, cosine_sim, vectorize_sparse
+
+QUERY = "god create heaven earth"
+TEXTS = [
+    "beginning god create heaven earth earth form void",
+    "heaven earth finish host god end work god make heaven earth",
+    "bless man walk counsel ungodly stand way sinner",
+    "god create heaven earth god create man",
+]
+
+
+def fit(scorer):
+    counts = vectorize_sparse(QUERY, *TEXTS)
+    return scorer(counts[1:]).scores_many(counts[:1])[0]
+
+
+def test_cosine_scorer():
+    assert list(fit(CosineScorer)) == pytest.approx(
+        [cosine_sim(QUERY, text) for text in TEXTS]
+    )
+
+
+def test_tfidf_scorer():
+    vectorizer = TfidfVectorizer(ngram_range=NGRAM_RANGE)
+    documents = vectorizer.fit_transform(TEXTS)
+    expected = cosine_similarity(vectorizer.transform([QUERY]), documents)[0]
+    assert list(fit(TfidfScorer)) == pytest.approx(list(expected))
+
+
+def test_bm25_scorer():
+    scores = fit(BM25Scorer)
+    assert scores[2] == 0.0
+    # Same n-grams as the query, in a shorter chapter than the second one
+    assert scores[3] > scores[0] > scores[1] > 0
+
+
+@pytest.mark.parametrize("scoring", ["cosine", "tfidf", "bm25"])
+def test_score_texts(scoring):
+    assert list(score_texts(QUERY.upper(), TEXTS, scoring=scoring)) == pytest.approx(
+        list(fit(scorer_class(scoring)))
+    )
+
+
+def test_unknown_scoring():
+    with pytest.raises(ValueError):
+        score_texts(QUERY, TEXTS, scoring="jaccard")
+
+
+def test_abstract_scorer():
+    with pytest.raises(TypeError):
+        Scorer(vectorize_sparse(*TEXTS))
+
+
+def test_scorings_names():
+    assert tuple(SCORERS) == SCORINGS
@@ -0,0 +1,99 @@
+import numpy as np  # type: ignore
+import pytest
+import spacy  # type: ignore
+
+from sklearn.metrics.pairwise import cosine_similarity  # type: ignore
+
+from ipybible.similarity import (
+    SpacyModels,
+    cosine_scores,
+    cosine_sim,
+    cosine_sims,
+    normalize_rows,
+    normalize_text,
+    normalize_texts,
+    text_key,
+    vectorize,
+    vectorize_sparse,
+)
+
+TEXTS = [
+    "god create heaven earth",
+    "heaven earth finish host god create heaven earth",
+    "bless man walk counsel",
+    "no shared word",
+]
+
+
+@pytest.fixture
+def loaded_names(monkeypatch):
+    loaded_names = []
+
+    def load(name, disable):
+        loaded_names.append((name, tuple(disable)))
+        return spacy.blank(name[:2])
+
+    monkeypatch.setattr(spacy, "load", load)
+    yield loaded_names
+
+
+def test_spacy_models_lazy(loaded_names):
+    models = SpacyModels({"EN": "en_core_web_sm", "NL": "nl_core_news_sm"})
+    assert loaded_names == []
+    assert "the" in models["EN"].stop_words
+    assert models["EN"] is models["EN"]
+    assert loaded_names == [("en_core_web_sm", ("parser", "ner"))]
+    assert not models.is_loaded("NL")
+
+
+def test_spacy_models_preload(loaded_names):
+    models = SpacyModels({"EN": "en_core_web_sm", "NL": "nl_core_news_sm"})
+    models.preload()
+    assert [name for name, _ in loaded_names] == ["en_core_web_sm", "nl_core_news_sm"]
+    with pytest.raises(KeyError):
+        models["FR"]
+
+
+def test_normalize_texts(spacy_load, monkeypatch):
+    spacy_model = SpacyModels({"EN": "en_core_web_sm"})["EN"]
+    piped_texts = []
+    pipe = spacy_model.nlp.pipe
+
+    def record_pipe(texts, **kwargs):
+        texts = list(texts)
+        piped_texts.extend(texts)
+        return pipe(texts, **kwargs)
+
+    monkeypatch.setattr(spacy_model.nlp, "pipe", record_pipe)
+    texts = [
+        "God created the Heaven",
+        "The earth was without form",
+        "God created the Heaven",
+        "And God saw the light",
+    ]
+    index = {text_key(texts[3]): "god see light"}
+    clean_texts = list(normalize_texts(texts, spacy_model, index, batch_size=1))
+    assert piped_texts == [texts[0].lower(), texts[1].lower()]
+    assert clean_texts == [
+        normalize_text(text, spacy_model, index_name={}) for text in texts[:3]
+    ] + ["god see light"]
+    assert index[text_key(texts[1])] == clean_texts[1]
+
+
+def test_cosine_sim():
+    dense = cosine_similarity(vectorize(TEXTS[0], TEXTS[1]))[0, 1]
+    assert cosine_sim(TEXTS[0], TEXTS[1]) == pytest.approx(dense)
+    assert cosine_sim(TEXTS[0], TEXTS[2]) == 0.0
+
+
+def test_cosine_sims():
+    ratios = cosine_sims(TEXTS[0].upper(), TEXTS[1:])
+    assert list(ratios) == pytest.approx([cosine_sim(TEXTS[0], t) for t in TEXTS[1:]])
+
+
+def test_cosine_scores_many():
+    vectors = normalize_rows(vectorize_sparse(*TEXTS))
+    scores = cosine_scores(vectors[:2], vectors)
+    assert scores.shape == (2, len(TEXTS))
+    assert scores == pytest.approx(cosine_similarity(vectors[:2], vectors))
+    assert np.diag(scores) == pytest.approx([1.0, 1.0])
@@ -0,0 +1,94 @@
+import pytest
+
+from diskcache import Cache, Index  # type: ignore
+
+from ipybible.store import (
+    LRUIndex,
+    Namespace,
+    get_many,
+    is_legacy_text_key,
+    set_many,
+)
+from ipybible.similarity import text_key
+
+
+@pytest.fixture
+def lru_index(tmp_path):
+    yield LRUIndex(Index(str(tmp_path)), maxsize=2)
+
+
+def test_lru_index_hits(lru_index):
+    lru_index["a"] = "clean a"
+    assert lru_index["a"] == "clean a"
+    assert lru_index.get("b") is None
+    assert lru_index.info() == dict(hits=1, misses=1, maxsize=2, currsize=1)
+
+
+def test_lru_index_eviction(lru_index):
+    for key in "abc":
+        lru_index[key] = f"clean {key}"
+    assert lru_index.info()["currsize"] == 2
+    # Evicted from memory, still in the index
+    assert lru_index["a"] == "clean a"
+    assert lru_index.info()["misses"] == 1
+    del lru_index["a"]
+    assert "a" not in lru_index
+
+
+def test_lru_index_many(lru_index):
+    lru_index["a"] = "clean a"
+    lru_index.set_many([("b", "clean b"), ("c", "clean c"), ("a", "new a")])
+    assert lru_index.info()["currsize"] == 1
+    assert lru_index.get_many(["a", "b", "d"]) == {"a": "new a", "b": "clean b"}
+
+
+def test_many_mapping():
+    index = {}
+    set_many(index, [("a", ""), ("b", "clean b")])
+    assert get_many(index, ["a", "c"]) == {"a": ""}
+
+
+def test_namespace_expire(tmp_path):
+    namespace = Namespace(
+        name="test",
+        directory=tmp_path,
+        size_limit=2 ** 20,
+        eviction_policy="least-frequently-used",
+    )
+    cache = namespace.open()
+    assert namespace.open() is cache
+    assert cache.eviction_policy == "least-frequently-used"
+    lru_index = LRUIndex(cache)
+    lru_index.set("query", "clean query", expire=-1)
+    lru_index.set("verse", "clean verse")
+    cache.expire()
+    assert "query" not in cache and "verse" in cache
+
+
+def test_lru_index_expire(tmp_path):
+    lru_index = LRUIndex(Cache(str(tmp_path)))
+    lru_index.set("query", "clean query", expire=-1)
+    lru_index.set("verse", "clean verse", expire=60)
+    # Expired from memory as well as from the index
+    assert lru_index.get("query") is None
+    assert "query" not in lru_index
+    assert lru_index.get_many(["query", "verse"]) == {"verse": "clean verse"}
+    assert lru_index.info()["currsize"] == 1
+
+
+def test_lru_index_frequency_counted(tmp_path):
+    cache = Cache(
+        str(tmp_path), eviction_policy="least-frequently-used", statistics=True
+    )
+    lru_index = LRUIndex(cache, maxsize=2)
+    lru_index["query"] = "result"
+    assert lru_index["query"] == lru_index.get("query") == "result"
+    # Every hit is counted by the index
+    assert cache.stats() == (2, 0)
+    assert lru_index.info()["currsize"] == 0
+
+
+def test_legacy_text_key():
+    assert is_legacy_text_key(text_key("In the beginning"))
+    assert not is_legacy_text_key("kjv")
+    assert not is_legacy_text_key(("clean_text", "kjv", "genesis", 1))